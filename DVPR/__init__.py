@@ -1 +1,3 @@
 from .schedule import *
+from .distance import toDistanceVector
+from .cache import ResultCache
@@ -0,0 +1,111 @@
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .distance import toDistanceVector
+from .instrumentation import metrics
+
+# the number of distances sampled into the key of a request
+KEY_SAMPLE_SIZE = 4096
+
+def requestKey(request, distances:np.ndarray = None) -> bytes:
+    """
+    Brief:
+        the content hash of a request: its order, item lists, number of riders and distances.
+        The deterministic serialization sorts the item maps, so equal requests hash equally
+        whatever order their items were inserted in. Serializing and hashing the whole
+        distance vector costs more than a hit saves on large snapshots, so the key only
+        covers its length, its CRC32 and a strided sample of it
+    Args:
+        request: the ScheduleRequest
+        distances: its distance vector from toDistanceVector, converted here if not given
+    """
+    distances = np.ascontiguousarray(toDistanceVector(request.distance) if distances is None else distances)
+    header = type(request)(request=request.request, itemlists=request.itemlists, num_deliverer=request.num_deliverer)
+    digest = hashlib.blake2b(np.array([len(distances), zlib.crc32(distances)], dtype=np.int64).tobytes(), digest_size=16)
+    digest.update(np.ascontiguousarray(distances[::max(1, len(distances) // KEY_SAMPLE_SIZE)]))
+    digest.update(header.SerializeToString(deterministic=True))
+    return digest.digest()
+
+class ResultCache:
+    """
+    The replies of recent requests, keyed by their content hash, so a request sent again,
+    e.g. retried or re-polled within the batching window, is answered without scheduling it.
+    It keeps at most maxSize replies, evicting the least recently used one, and a reply
+    expires ttl seconds after it was scheduled. All of the methods are thread safe.
+    The server keeps it in front of the scheduler and its process pool, RouteScheduler
+    itself always schedules.
+    """
+    def __init__(self, maxSize:int = 256, ttl:float = 60.0):
+        """
+        Args:
+            maxSize: the number of replies kept
+            ttl: the seconds a reply stays valid, None to keep it until it is evicted
+        """
+        if maxSize < 1:
+            raise ValueError("The result cache needs room for at least one reply")
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # key -> (expiry, reply)
+        self.numHit = 0
+        self.numMiss = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, request, distances:np.ndarray = None):
+        """
+        Brief:
+            look a request up
+        Args:
+            request: the ScheduleRequest
+            distances: its distance vector from toDistanceVector, converted here if not given
+        Returns:
+            key (bytes) : the key to store the reply of the request under
+            reply (ScheduleReply) : a copy of the cached reply, None on a miss
+        """
+        key = requestKey(request, distances)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                metrics.increment("cache_evictions", reason="expired")
+                entry = None
+            if entry is None:
+                self.numMiss += 1
+            else:
+                self.entries.move_to_end(key)
+                self.numHit += 1
+        metrics.increment("cache_requests", outcome="miss" if entry is None else "hit")
+        if entry is None:
+            return key, None
+        reply = type(entry[1])()
+        reply.CopyFrom(entry[1])
+        return key, reply
+
+    def store(self, key:bytes, reply):
+        """
+        Brief:
+            cache the reply of the request of the given key
+        """
+        stored = type(reply)()
+        stored.CopyFrom(reply)
+        expiry = time.monotonic() + self.ttl if self.ttl is not None else None
+        numEvicted = 0
+        with self.lock:
+            self.entries[key] = (expiry, stored)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+                numEvicted += 1
+        if numEvicted > 0:
+            metrics.increment("cache_evictions", numEvicted, reason="size")
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
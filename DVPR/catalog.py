@@ -0,0 +1,71 @@
+import numpy as np
+
+class ItemCatalog:
+    """
+    Intern item names to integer ids, the ids index the item axis of the supply matrix.
+    """
+    def __init__(self, names = ()):
+        self.index = {} # item name -> item id
+        self.names = [] # item id -> item name
+        for name in names:
+            self.intern(name)
+
+    def intern(self, name:str) -> int:
+        """
+        Brief:
+            return the id of the item, a new id is assigned to an unseen item
+        """
+        itemId = self.index.get(name)
+        if itemId is None:
+            itemId = len(self.names)
+            self.index[name] = itemId
+            self.names.append(name)
+        return itemId
+
+    def toVector(self, items:dict) -> np.ndarray:
+        """
+        Brief:
+            convert an item dict to a dense vector over the catalog, non-positive amounts are dropped
+        """
+        vector = np.zeros(len(self.names))
+        for name, amount in items.items():
+            if amount > 0.0:
+                vector[self.intern(name)] = amount
+        return vector
+
+    def toDict(self, vector:np.ndarray, itemIds = None) -> dict:
+        """
+        Brief:
+            convert a vector back to an item dict
+        Args:
+            vector: the amounts, over the whole catalog or over itemIds
+            itemIds: the item ids of the entries of vector, the positive entries of a catalog vector by default
+        """
+        if itemIds is None:
+            itemIds = np.flatnonzero(vector > 0)
+            vector = vector[itemIds]
+        return {self.names[itemId]: amount for itemId, amount in zip(itemIds.tolist(), vector.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+def buildSupplyMatrix(itemlists, catalog:ItemCatalog) -> np.ndarray:
+    """
+    Brief:
+        build the supplier x item stock matrix of a request, interning the item names into the catalog
+    Args:
+        itemlists: the item dict of each supplier, ordered by supplier id
+        catalog: the item catalog, extended with the unseen items
+    Returns:
+        supply (np.ndarray) : (n+1) x len(catalog) matrix indexed by supplier id, row 0 is unused
+    """
+    rows, cols, amounts = [], [], []
+    for index, items in enumerate(itemlists):
+        for name, amount in items.items():
+            if amount > 0.0:
+                rows.append(index + 1)
+                cols.append(catalog.intern(name))
+                amounts.append(amount)
+    supply = np.zeros((len(itemlists) + 1, len(catalog)))
+    supply[rows, cols] = amounts
+    return supply
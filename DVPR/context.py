@@ -0,0 +1,141 @@
+import numpy as np
+
+from .role import Supplier, Rider, Order
+from .catalog import ItemCatalog
+
+def sliceIndices(starts:np.ndarray, sizes:np.ndarray) -> np.ndarray:
+    """
+    Brief:
+        return the indices of the concatenation of the slices [start, start + size) of a CSR array
+    """
+    offsets = np.cumsum(sizes) - sizes
+    return np.repeat(starts - offsets, sizes) + np.arange(sizes.sum())
+
+class ScheduleContext:
+    """
+    Per-request scheduling state. The RouteScheduler only keeps its configuration,
+    so one scheduler can serve concurrent requests with a context for each of them.
+
+    The state is kept as arrays indexed by unit id (0 for the order, 1..n for suppliers,
+    n+1..n+m for riders). Neighbor lists are CSR pairs of an indptr array indexed by
+    supplier id and an array of ids, and the cluster members are a CSR over cluster indices.
+    Missing units are -1.
+    """
+    def __init__(self, order:Order, numSupplier:int, numRider:int, distanceMatrix:np.ndarray, catalog:ItemCatalog, supply:np.ndarray, aroundScope:float):
+        self.order = order
+        self.numSupplier = numSupplier
+        self.numRider = numRider
+        self.distanceMatrix = distanceMatrix
+        self.catalog = catalog
+        self.supply = supply # supplier id x item id stock matrix
+        self.aroundScope = aroundScope
+        self.supplierIds = np.arange(1, numSupplier + 1)
+        self.distanceToOrder = distanceMatrix[0, :numSupplier + 1].copy()
+
+        # the suppliers within aroundScope of each supplier
+        self.aroundIndptr = np.zeros(numSupplier + 2, dtype=np.int64)
+        self.aroundIds = np.zeros(0, dtype=np.int64)
+
+        # the free riders and the riders attached to each supplier
+        self.freeRiders = np.arange(numSupplier + 1, numSupplier + numRider + 1)
+        self.riderNearestSupplier = np.full(numSupplier + numRider + 1, -1, dtype=np.int64) # rider id -> supplier id
+        self.riderNearestDistance = np.full(numSupplier + numRider + 1, np.inf)
+        self.aroundRiderIndptr = np.zeros(numSupplier + 2, dtype=np.int64)
+        self.aroundRiderIds = np.zeros(0, dtype=np.int64)
+        self.aroundRiderDistances = np.zeros(0)
+        self.nearestRider = np.full(numSupplier + 1, -1, dtype=np.int64) # supplier id -> rider id
+        self.nearestRiderDistance = np.full(numSupplier + 1, np.inf)
+
+        # the clusters, each one is identified by its index and centered at clusterCenters[index]
+        self.clusterOf = np.full(numSupplier + 1, -1, dtype=np.int64) # supplier id -> center id
+        self.distanceToClusterCenter = np.full(numSupplier + 1, np.inf)
+        self.clusterCenters = np.zeros(0, dtype=np.int64)
+        self.clusterIndex = np.full(numSupplier + 1, -1, dtype=np.int64) # center id -> cluster index
+        self.memberIndptr = np.zeros(1, dtype=np.int64)
+        self.memberIds = np.zeros(0, dtype=np.int64) # the members of each cluster in ranked order
+        self.clusterOrder = np.zeros(0, dtype=np.int64) # the ranked cluster indices
+        self.clusterSupply = None # center id x item id total stock of the cluster members
+
+        # the priorities of the order, computed once per order
+        self.supplierPriority = np.full(numSupplier + 1, np.nan) # supplier id -> priority
+        self.clusterPriority = np.zeros(0) # cluster index -> priority
+        self.rankedMemberIds = np.zeros(0, dtype=np.int64) # the members of each cluster in priority order
+        self.best_route = None
+        self.routeBuilder = None # the incremental route builder of the local search
+        self.deadline = None # the time.monotonic() at which the local search stops
+        self.numIteration = 0 # the local search iterations run
+        self.numMemoHit = 0 # the moves skipped because their ranking was already evaluated
+        self.numTabuHit = 0 # the moves skipped because they were tabu
+        self.costTrace = [] # (seconds, iteration, best cost) of the last local search at each improvement
+        self.random = None # the random.Random of the local search, None for the global random module
+        self.batchRandom = None # the numpy Generator of the batched local search, seeded from random
+        self.searchHorizon = 0 # the longest ranking prefix a route of the local search depended on
+
+        self.warmRoute = None # the suppliers of the best route of the previous request in visiting order, None for a cold start
+
+    @property
+    def suppliers(self) -> list:
+        return [Supplier(self, id) for id in self.supplierIds.tolist()]
+
+    @property
+    def riders(self) -> list:
+        return [Rider(self, id) for id in self.freeRiders.tolist()]
+
+    def getAroundSuppliers(self, supplierId:int) -> np.ndarray:
+        return self.aroundIds[self.aroundIndptr[supplierId]:self.aroundIndptr[supplierId + 1]]
+
+    def getAroundRiders(self, supplierId:int):
+        start, end = self.aroundRiderIndptr[supplierId], self.aroundRiderIndptr[supplierId + 1]
+        return self.aroundRiderIds[start:end], self.aroundRiderDistances[start:end]
+
+    def getClusterMembers(self, clusterIndex:int) -> np.ndarray:
+        """
+        Brief:
+            return the members of a cluster, a view that can be reordered in place
+        """
+        return self.memberIds[self.memberIndptr[clusterIndex]:self.memberIndptr[clusterIndex + 1]]
+
+    def getRankedClusterMembers(self, clusterIndex:int) -> np.ndarray:
+        """
+        Brief:
+            return the members of a cluster in priority order
+        """
+        return self.rankedMemberIds[self.memberIndptr[clusterIndex]:self.memberIndptr[clusterIndex + 1]]
+
+    def getRankedSuppliers(self, clusterOrder:np.ndarray) -> np.ndarray:
+        """
+        Brief:
+            concatenate the members of the clusters in the given order
+        Args:
+            clusterOrder: the ranked cluster indices
+        Returns:
+            (np.ndarray) : the ranked supplier ids
+        """
+        starts = self.memberIndptr[clusterOrder]
+        sizes = self.memberIndptr[clusterOrder + 1] - starts
+        return self.memberIds[sliceIndices(starts, sizes)]
+
+    def getDistance(self, id1:int, id2:int):
+        """
+        Brief:
+            return distance between two units
+        Args:
+            id1: id of first unit
+            id2: id of second unit
+        Returns:
+            distance between two units
+        """
+        return self.distanceMatrix[id1, id2]
+
+    def getDistances(self, ids1, ids2):
+        """
+        Brief:
+            return the block of distances between two groups of units
+        Args:
+            ids1: ids of the row units
+            ids2: ids of the column units
+        Returns:
+            (np.ndarray) : len(ids1) x len(ids2) distance block, in float64 whatever the
+                storage type of the matrix
+        """
+        return self.distanceMatrix[np.ix_(ids1, ids2)].astype(np.float64, copy=False)
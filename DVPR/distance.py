@@ -0,0 +1,98 @@
+import numpy as np
+
+# the rows of the distance matrix mirrored at once
+MIRROR_BLOCK = 128
+
+def toDistanceVector(distances) -> np.ndarray:
+    """
+    Brief:
+        convert the repeated double field of a request into a contiguous float64 array,
+        without going through a list of Python floats
+    Args:
+        distances: the repeated field, or any sequence or array of distances
+    Returns:
+        vector (np.ndarray) : the distances, the given array itself if it already is one
+    """
+    if isinstance(distances, np.ndarray) or hasattr(distances, "__array__"):
+        # the upb repeated fields copy their values in C
+        return np.asarray(distances, dtype=np.float64)
+    return np.fromiter(distances, dtype=np.float64, count=len(distances))
+
+def buildDistanceMatrix(distances, numSupplier:int, numRider:int, dtype = np.float64) -> np.ndarray:
+    """
+    Brief:
+        convert the condensed distance vector of a request into a dense symmetric matrix
+        indexed by unit id (0 for the order, 1..n for suppliers, n+1..n+m for riders)
+    Args:
+        distances: the condensed distance vector, the order to every supplier followed by
+            the upper triangle of the supplier and rider distances
+        numSupplier: number of suppliers
+        numRider: number of riders
+        dtype: the storage type of the matrix, np.float32 halves its memory
+    Returns:
+        matrix (np.ndarray) : the (n+m+1) x (n+m+1) distance matrix, distances between
+            the order and riders are set to inf
+    """
+    n = numSupplier
+    m = numSupplier + numRider
+    distances = toDistanceVector(distances)
+    validateDistances(distances, n, m)
+
+    matrix = np.empty((m + 1, m + 1), dtype=dtype)
+    matrix[0, 1:n + 1] = matrix[1:n + 1, 0] = distances[:n]
+    matrix[0, n + 1:] = matrix[n + 1:, 0] = np.inf
+    # copy each row of the upper triangle
+    start = n
+    for row in range(1, m + 1):
+        end = start + m - row
+        matrix[row, row + 1:] = distances[start:end]
+        start = end
+    # mirror it by blocks of rows, a strided column write per row is slower
+    for first in range(1, m + 1, MIRROR_BLOCK):
+        last = min(first + MIRROR_BLOCK, m + 1)
+        matrix[first:last, 1:first] = matrix[1:first, first:last].T
+        block = matrix[first:last, first:last]
+        lower = np.tril_indices(last - first, -1)
+        block[lower] = block.T[lower]
+    np.fill_diagonal(matrix, 0)
+    return matrix
+
+def validateDistances(distances:np.ndarray, n:int, m:int):
+    """
+    Brief:
+        check the condensed distance vector once at ingestion
+    Args:
+        distances: the condensed distance vector
+        n: number of suppliers
+        m: number of suppliers and riders
+    """
+    expected = n + m * (m - 1) // 2
+    if distances.ndim != 1 or len(distances) != expected:
+        raise ValueError("Invalid distance vector length {}, expected {} for {} suppliers and {} riders".format(
+            distances.size, expected, n, m - n))
+    # one pass for both checks, NaN fails the comparison too
+    if not (distances >= 0).all():
+        if np.isnan(distances).any():
+            raise ValueError("Distance vector contains NaN")
+        raise ValueError("Distances must be non-negative")
+
+def setOrderDistances(matrix:np.ndarray, distances, numSupplier:int) -> np.ndarray:
+    """
+    Brief:
+        overwrite the distances between the order and the suppliers with those of another request
+    Args:
+        matrix: the distance matrix built by buildDistanceMatrix
+        distances: the condensed distance vector of the other request
+        numSupplier: number of suppliers
+    Returns:
+        distanceToOrder (np.ndarray) : the new distances from the order to each supplier
+    """
+    m = matrix.shape[0] - 1
+    if len(distances) != numSupplier + m * (m - 1) // 2:
+        raise ValueError("The distance vector doesn't match the suppliers and riders of the matrix")
+    distanceToOrder = toDistanceVector(distances[:numSupplier])
+    if np.isnan(distanceToOrder).any() or (distanceToOrder < 0).any():
+        raise ValueError("Distances must be non-negative")
+    matrix[0, 1:numSupplier + 1] = distanceToOrder
+    matrix[1:numSupplier + 1, 0] = distanceToOrder
+    return distanceToOrder
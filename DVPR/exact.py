@@ -0,0 +1,85 @@
+import numpy as np
+
+# the most suppliers solveExact is given, its tables grow as 2^k * k and 16 already takes about 100 MB
+MAX_EXACT_SUPPLIERS = 16
+
+def coverMasks(supply:np.ndarray, need:np.ndarray):
+    """
+    Brief:
+        compute which subsets of the suppliers satisfy the order, and which of them are
+        minimal, i.e. every supplier of the subset is needed
+    Args:
+        supply: the stock of each requested item of each supplier, k x items
+        need: the requested amount of each item
+    Returns:
+        (total, minimal) : the total stock of each subset mask and whether it is a minimal cover
+    """
+    numSupplier = len(supply)
+    total = np.zeros((1 << numSupplier, len(need)))
+    for bit in range(numSupplier):
+        total[1 << bit:1 << (bit + 1)] = total[:1 << bit] + supply[bit]
+    covered = np.all(total >= need, axis=1)
+    minimal = covered.copy()
+    masks = np.arange(1 << numSupplier)
+    for bit in range(numSupplier):
+        withBit = (masks >> bit) & 1 == 1
+        minimal[withBit] &= ~covered[masks[withBit] ^ (1 << bit)]
+    return total, minimal
+
+def solveExact(distances:np.ndarray, startDistance:np.ndarray, orderDistance:np.ndarray, supply:np.ndarray, need:np.ndarray):
+    """
+    Brief:
+        find the cheapest route over a small set of suppliers with a dynamic program over
+        subsets (Held-Karp). cost[mask, last] is the cheapest path from a rider through the
+        suppliers of mask ending at last, and the route is the best path over a minimal
+        cover of the order followed by the way to the order. Only minimal covers are
+        considered so every visited supplier gives some items, as in the heuristic routes.
+    Args:
+        distances: the distances between the suppliers, k x k
+        startDistance: the distance of each supplier to its nearest free rider
+        orderDistance: the distance of each supplier to the order
+        supply: the stock of each requested item of each supplier, k x items
+        need: the requested amount of each item
+    Returns:
+        (cost, visits, total) : the optimal cost, the supplier indices in visiting order and
+            the total stock of the visited suppliers, None if no subset satisfies the order
+    """
+    numSupplier = len(supply)
+    total, minimal = coverMasks(supply, need)
+    if not minimal.any():
+        return None
+
+    numMask = 1 << numSupplier
+    cost = np.full((numMask, numSupplier), np.inf)
+    parent = np.full((numMask, numSupplier), -1, dtype=np.int64)
+    suppliers = np.arange(numSupplier)
+    cost[1 << suppliers, suppliers] = startDistance
+    masks = np.arange(numMask)
+    popcount = np.zeros(numMask, dtype=np.int64)
+    for bit in range(numSupplier):
+        popcount += (masks >> bit) & 1
+
+    # extend the paths one supplier at a time, each layer only reads the previous one
+    for size in range(2, numSupplier + 1):
+        layer = masks[popcount == size]
+        inLayer = (layer[:, None] >> suppliers[None, :]) & 1 == 1 # mask x last
+        source = layer[:, None] ^ (1 << suppliers[None, :]) # the mask before visiting last
+        candidates = cost[source] + distances.T[None, :, :] # mask x last x previous
+        previous = np.argmin(candidates, axis=2)
+        best = np.take_along_axis(candidates, previous[:, :, None], axis=2)[:, :, 0]
+        cost[layer] = np.where(inLayer, best, np.inf)
+        parent[layer] = np.where(inLayer, previous, -1)
+
+    routeCost = np.where(minimal[:, None], cost + orderDistance[None, :], np.inf)
+    mask, last = np.unravel_index(np.argmin(routeCost), routeCost.shape)
+    if not np.isfinite(routeCost[mask, last]):
+        return None
+    bestCost, bestMask = float(routeCost[mask, last]), int(mask)
+
+    # walk the parents back to the first supplier
+    visits = []
+    mask, last = int(mask), int(last)
+    while last >= 0:
+        visits.append(last)
+        mask, last = mask ^ (1 << last), int(parent[mask, last])
+    return bestCost, np.array(visits[::-1], dtype=np.int64), total[bestMask]
@@ -0,0 +1,208 @@
+import numpy as np
+
+from .role import Rider, Route
+
+def allocateItems(supply:np.ndarray, need:np.ndarray, before:np.ndarray) -> np.ndarray:
+    """
+    Brief:
+        the items taken from each of a run of visited suppliers, each one gives what is
+        still missing after the suppliers before it, up to its stock
+    Args:
+        supply: the stock of each requested item of each visited supplier
+        need: the requested amount of each item
+        before: the item totals before each visited supplier
+    Returns:
+        itemlists (np.ndarray) : the amount of each item taken from each supplier
+    """
+    after = before + supply
+    return np.where(before > need, 0, np.where(after > need, need - before, supply))
+
+class RouteBuilder:
+    """
+    Build the greedy-insertion route of a supplier ranking incrementally.
+
+    The builder keeps the prefix state of the last ranking it built: the item totals
+    after each ranked position, the accepted suppliers and the partial path cost. A new
+    ranking is only replayed from the first position where it differs from the last one,
+    and positions after the one that satisfies the order are never visited.
+
+    Every visited supplier adds its whole stock to the totals, accepted or not, so the
+    totals of a run of positions are a prefix sum of the supply rows and the positions
+    are replayed in vectorized chunks.
+    """
+    def __init__(self, context, chunkSize:int = 32):
+        self.context = context
+        self.order = context.order
+        self.distanceMatrix = context.distanceMatrix
+        self.orderSupply = context.supply[:, self.order.itemIds] # supplier id -> the stock of each requested item
+        self.chunkSize = chunkSize
+        self.capacity = 0
+        self.reset()
+
+    def reset(self):
+        self.numProcessed = 0 # number of processed positions
+        self.numTaken = 0 # number of accepted suppliers
+        self.rider = -1
+        self.satisfied = self.isEnough(np.zeros(len(self.order.itemIds)))
+        self.cost = float("inf")
+
+    def reserve(self, size:int):
+        """
+        Brief:
+            allocate the prefix state for rankings of the given size
+        """
+        if size <= self.capacity:
+            return
+        numItems = len(self.order.itemIds)
+        self.capacity = size
+        self.ranking = np.zeros(size, dtype=np.int64) # supplier ids of the processed positions
+        self.totals = np.zeros((size, numItems)) # item totals after each processed position
+        self.numAccepted = np.zeros(size, dtype=np.int64) # number of accepted suppliers after each processed position
+        self.itemlists = np.zeros((size, numItems)) # the items taken from each accepted supplier
+        self.pathCost = np.zeros(size) # cost from the rider to each accepted supplier
+        self.acceptedIds = np.zeros(size, dtype=np.int64) # accepted suppliers in visiting order
+        self.reset()
+
+    def isEnough(self, totalItems:np.ndarray) -> bool:
+        return bool(np.all(totalItems >= self.order.need))
+
+    def firstChangedPosition(self, rankedSuppliers:np.ndarray) -> int:
+        """
+        Brief:
+            find the first processed position where the given ranking differs from the last one
+        Returns:
+            position (int) : the first changed position, or None if the route is unchanged
+        """
+        prefix = rankedSuppliers[:self.numProcessed]
+        changed = np.flatnonzero(prefix != self.ranking[:len(prefix)])
+        if len(changed) > 0:
+            return int(changed[0])
+        if len(prefix) < self.numProcessed:
+            return len(prefix)
+        if self.satisfied or len(rankedSuppliers) == self.numProcessed:
+            return None
+        return self.numProcessed
+
+    def truncate(self, position:int):
+        """
+        Brief:
+            drop the prefix state from the given position on
+        """
+        self.numProcessed = position
+        self.numTaken = int(self.numAccepted[position - 1])
+        self.satisfied = self.isEnough(self.totals[position - 1])
+
+    def build(self, rankedSuppliers:np.ndarray) -> float:
+        """
+        Brief:
+            replay the greedy insertion of the ranking from the first changed position
+        Args:
+            rankedSuppliers: the supplier ids in ranked order
+        Returns:
+            cost (float) : the cost of the resulting route
+        """
+        self.reserve(len(rankedSuppliers))
+        position = self.firstChangedPosition(rankedSuppliers) if self.numProcessed > 0 else 0
+        if position is None:
+            return self.cost
+        if position == 0:
+            self.reset()
+            self.rider = int(self.context.nearestRider[rankedSuppliers[0]]) if len(rankedSuppliers) > 0 else -1
+        else:
+            self.truncate(position)
+
+        need = self.order.need
+        chunkSize = self.chunkSize
+        while not self.satisfied and position < len(rankedSuppliers):
+            ids = rankedSuppliers[position:position + chunkSize]
+            supply = self.orderSupply[ids]
+            before = self.totals[position - 1] if position > 0 else np.zeros(len(need))
+            after = np.cumsum(np.vstack([before, supply]), axis=0)
+            before, after = after[:-1], after[1:]
+
+            # stop at the first position that satisfies the order
+            enough = np.all(after >= need, axis=1)
+            if enough.any():
+                end = int(np.argmax(enough)) + 1
+                before, after, supply, ids = before[:end], after[:end], supply[:end], ids[:end]
+                self.satisfied = True
+            itemlists = allocateItems(supply, need, before)
+            accepted = np.flatnonzero(itemlists.sum(axis=1) > 0)
+
+            # extend the path cost with the accepted suppliers
+            if len(accepted) > 0:
+                acceptedIds = ids[accepted]
+                previous = self.acceptedIds[self.numTaken - 1] if self.numTaken > 0 else self.rider
+                edges = self.distanceMatrix[np.concatenate([[previous], acceptedIds[:-1]]), acceptedIds]
+                start = self.pathCost[self.numTaken - 1] if self.numTaken > 0 else 0
+                taken = slice(self.numTaken, self.numTaken + len(accepted))
+                self.pathCost[taken] = np.cumsum(np.concatenate([[start], edges]))[1:]
+                self.acceptedIds[taken] = acceptedIds
+                self.itemlists[taken] = itemlists[accepted]
+
+            processed = slice(position, position + len(ids))
+            self.ranking[processed] = ids
+            self.totals[processed] = after
+            self.numAccepted[processed] = self.numTaken + np.cumsum(itemlists.sum(axis=1) > 0)
+            self.numTaken += len(accepted)
+            self.numProcessed = position = position + len(ids)
+            chunkSize *= 2
+
+        if self.numTaken == 0:
+            self.cost = float("inf")
+        else:
+            self.cost = float(self.pathCost[self.numTaken - 1] + self.distanceMatrix[self.acceptedIds[self.numTaken - 1], self.order.id])
+        return self.cost
+
+    def evaluate(self, rankings:np.ndarray):
+        """
+        Brief:
+            compute the route cost of many rankings at once, without changing the prefix state.
+            Each ranking is cut at the first position that satisfies the order, and the path of
+            its accepted suppliers is summed with fancy indexing on the distance matrix. The
+            costs are the ones build would return for each ranking.
+        Args:
+            rankings: the first positions of the rankings, rankings x positions
+        Returns:
+            (costs, ends, satisfied) : the route cost of each ranking, the number of positions
+                the route depends on and whether the order is satisfied within the given
+                positions. The cost of an unsatisfied ranking only holds if it is complete
+        """
+        numRanking, length = rankings.shape
+        need = self.order.need
+        prefix = rankings
+        supply = self.orderSupply[prefix] # ranking x position x item
+        after = np.cumsum(supply, axis=1)
+        enough = np.all(after >= need, axis=2)
+        satisfied = enough.any(axis=1)
+        ends = np.where(satisfied, np.argmax(enough, axis=1) + 1, length)
+
+        positions = np.arange(length)
+        before = np.concatenate([np.zeros((numRanking, 1, len(need))), after[:, :-1]], axis=1)
+        itemlists = allocateItems(supply, need, before)
+        taken = (itemlists.sum(axis=2) > 0) & (positions[None, :] < ends[:, None])
+
+        # the previous accepted supplier of each position, the rider before the first one
+        lastTaken = np.maximum.accumulate(np.where(taken, positions[None, :], -1), axis=1)
+        previous = np.concatenate([np.full((numRanking, 1), -1), lastTaken[:, :-1]], axis=1)
+        rows = np.arange(numRanking)[:, None]
+        riders = self.context.nearestRider[rankings[:, 0]]
+        previousIds = np.where(previous >= 0, prefix[rows, np.maximum(previous, 0)], riders[:, None])
+        edges = np.where(taken, self.distanceMatrix[previousIds, prefix].astype(np.float64, copy=False), 0)
+        last = lastTaken[:, -1]
+        costs = np.cumsum(edges, axis=1)[:, -1] + self.distanceMatrix[prefix[rows[:, 0], np.maximum(last, 0)], self.order.id]
+        return np.where(last >= 0, costs, np.inf), ends, satisfied
+
+    def toRoute(self) -> Route:
+        """
+        Brief:
+            materialize the last built ranking as a Route
+        """
+        route = Route(self.order)
+        route.setRider(Rider(self.context, self.rider) if self.rider > 0 else None)
+        supplierIds = self.acceptedIds[:self.numTaken].copy()
+        route.setSuppliers(supplierIds, self.itemlists[:self.numTaken].copy(), self.context.clusterOf[supplierIds])
+        if self.numProcessed > 0:
+            route.totalItems = self.totals[self.numProcessed - 1].copy()
+        route.setCost(self.cost)
+        return route
@@ -0,0 +1,133 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# default histogram buckets, upper bounds
+SECOND_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+RATIO_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+
+class Histogram:
+    """
+    A cumulative histogram over fixed buckets, in the Prometheus layout.
+    """
+    def __init__(self, buckets:tuple):
+        self.buckets = tuple(buckets)
+        self.counts = np.zeros(len(self.buckets) + 1, dtype=np.int64) # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value:float):
+        self.counts[np.searchsorted(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """
+    The counters and histograms of the scheduler in this process. Every series is keyed by
+    a name and a sorted tuple of label pairs, e.g. ("phase_seconds", (("phase", "greedy"),)).
+    All of the methods are thread safe, so the gRPC worker threads share one registry.
+    """
+    def __init__(self, prefix:str = "ess_"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def increment(self, name:str, value:float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name:str, value:float, buckets:tuple = SECOND_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, name:str, **labels):
+        """
+        Brief:
+            observe the seconds the block takes in the histogram of the given name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """
+        Brief:
+            return a plain copy of every series, that can be pickled or merged into another registry
+        """
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {key: (histogram.buckets, histogram.counts.copy(), histogram.sum, histogram.count) for key, histogram in self.histograms.items()},
+            }
+
+    def drain(self) -> dict:
+        """
+        Brief:
+            return the snapshot of every series and reset them
+        """
+        with self.lock:
+            snapshot = {
+                "counters": self.counters,
+                "histograms": {key: (histogram.buckets, histogram.counts, histogram.sum, histogram.count) for key, histogram in self.histograms.items()},
+            }
+            self.counters, self.histograms = {}, {}
+            return snapshot
+
+    def merge(self, snapshot:dict):
+        """
+        Brief:
+            add the series of a snapshot, e.g. the one drained from a process pool worker
+        """
+        with self.lock:
+            for key, value in snapshot["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, (buckets, counts, total, count) in snapshot["histograms"].items():
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(buckets)
+                histogram = self.histograms[key]
+                histogram.counts += counts
+                histogram.sum += total
+                histogram.count += count
+
+    def render(self) -> str:
+        """
+        Brief:
+            render every series in the Prometheus text exposition format
+        """
+        def formatLabels(labels, extra = ()):
+            pairs = list(labels) + list(extra)
+            if len(pairs) == 0:
+                return ""
+            return "{" + ",".join('{}="{}"'.format(name, value) for name, value in pairs) + "}"
+
+        snapshot = self.snapshot()
+        lines = []
+        for name in sorted(set(key[0] for key in snapshot["counters"])):
+            lines.append("# TYPE {}{}_total counter".format(self.prefix, name))
+            for (seriesName, labels), value in sorted(snapshot["counters"].items()):
+                if seriesName == name:
+                    lines.append("{}{}_total{} {}".format(self.prefix, name, formatLabels(labels), value))
+        for name in sorted(set(key[0] for key in snapshot["histograms"])):
+            lines.append("# TYPE {}{} histogram".format(self.prefix, name))
+            for (seriesName, labels), (buckets, counts, total, count) in sorted(snapshot["histograms"].items(), key=lambda item: item[0]):
+                if seriesName != name:
+                    continue
+                for bound, cumulative in zip(list(buckets) + ["+Inf"], np.cumsum(counts).tolist()):
+                    lines.append("{}{}_bucket{} {}".format(self.prefix, name, formatLabels(labels, [("le", bound)]), cumulative))
+                lines.append("{}{}_sum{} {}".format(self.prefix, name, formatLabels(labels), total))
+                lines.append("{}{}_count{} {}".format(self.prefix, name, formatLabels(labels), count))
+        return "\n".join(lines) + "\n"
+
+# the registry of this process
+metrics = Metrics()
@@ -0,0 +1,101 @@
+import numpy as np
+
+class MoveBatch:
+    """
+    A batch of local search moves drawn at once around the current cluster ranking, with
+    the same move distribution as RouteScheduler.getLocalCluster: half of them swap two
+    clusters, the other half reorder the members of a used cluster, back to their
+    priority order one time out of ten and randomly otherwise.
+
+    The ranking of each move is the current ranking with one or two cluster segments moved,
+    so the rankings of the batch are built for any prefix length as a gather of the current
+    ranking through an index map computed for all the moves at once.
+    """
+    def __init__(self, context, rng:np.random.Generator, size:int, numUsedClusters:int):
+        self.context = context
+        self.order = context.clusterOrder
+        self.base = context.getRankedSuppliers(self.order) # the current ranking
+        self.sizes = context.memberIndptr[self.order + 1] - context.memberIndptr[self.order] # cluster position -> size
+        self.starts = np.cumsum(self.sizes) - self.sizes # cluster position -> first ranking position
+
+        numCluster = len(self.order)
+        self.isSwap = rng.random(size) < 0.5
+        first = rng.integers(numUsedClusters, size=size)
+        second = np.where(rng.random(size) < 0.5, rng.integers(numUsedClusters, size=size),
+                          numUsedClusters - 1 + rng.integers(numCluster - numUsedClusters + 1, size=size))
+        # the swapped cluster positions, or the position of the reordered cluster in both
+        self.low = np.where(self.isSwap, np.minimum(first, second), first)
+        self.high = np.where(self.isSwap, np.maximum(first, second), first)
+        self.isReset = ~self.isSwap & (rng.random(size) < 0.1)
+
+        # a random permutation of each reordered cluster, as offsets in the cluster
+        segmentSizes = np.where(self.isSwap, 0, self.sizes[self.low])
+        width = max(int(segmentSizes.max()), 1)
+        keys = np.where(np.arange(width)[None, :] < segmentSizes[:, None], rng.random((size, width)), np.inf)
+        self.permutation = np.argsort(keys, axis=1)
+
+    def getMove(self, index:int):
+        """
+        Brief:
+            return the tabu move of a swap, the swapped cluster indices, None for the other moves
+        """
+        if not self.isSwap[index]:
+            return None
+        clusters = self.order[[self.low[index], self.high[index]]]
+        return (int(clusters.min()), int(clusters.max()))
+
+    def getRankings(self, rows:np.ndarray, length:int) -> np.ndarray:
+        """
+        Brief:
+            build the first positions of the rankings of some moves
+        Args:
+            rows: the moves
+            length: the number of positions built
+        Returns:
+            rankings (np.ndarray) : the supplier ids, moves x positions
+        """
+        position = np.arange(length)[None, :]
+        low, high = self.low[rows][:, None], self.high[rows][:, None]
+        lowStart, lowSize = self.starts[low], self.sizes[low]
+        highStart, highSize = self.starts[high], self.sizes[high]
+        lowEnd, highEnd = lowStart + lowSize, highStart + highSize
+
+        # swap: the high segment, the clusters in between, then the low segment
+        swap = self.isSwap[rows][:, None] & (low != high)
+        source = np.broadcast_to(position, (len(rows), length))
+        source = np.where(swap & (position >= lowStart) & (position < lowStart + highSize), highStart + position - lowStart, source)
+        source = np.where(swap & (position >= lowStart + highSize) & (position < highEnd - lowSize), lowEnd + position - lowStart - highSize, source)
+        source = np.where(swap & (position >= highEnd - lowSize) & (position < highEnd), lowStart + position - highEnd + lowSize, source)
+
+        # reorder: permute the segment of the cluster
+        inSegment = ~self.isSwap[rows][:, None] & (position >= lowStart) & (position < lowEnd)
+        offset = np.clip(position - lowStart, 0, self.permutation.shape[1] - 1)
+        source = np.where(inSegment, lowStart + self.permutation[rows[:, None], offset], source)
+        rankings = self.base[source]
+
+        # reset: the members of the cluster in priority order
+        reset = inSegment & self.isReset[rows][:, None]
+        if reset.any():
+            ranked = self.context.memberIndptr[self.order[low]] + offset
+            rankings = np.where(reset, self.context.rankedMemberIds[np.minimum(ranked, len(self.context.rankedMemberIds) - 1)], rankings)
+        return rankings
+
+    def apply(self, index:int):
+        """
+        Brief:
+            apply a move to the context, its cluster ranking and the members of its cluster
+        Returns:
+            clusters (np.ndarray) : the ranked cluster indices of the move
+        """
+        clusters = self.order.copy()
+        low, high = self.low[index], self.high[index]
+        if self.isSwap[index]:
+            clusters[low], clusters[high] = clusters[high], clusters[low]
+            return clusters
+        cluster = clusters[low]
+        if self.isReset[index]:
+            self.context.getClusterMembers(cluster)[:] = self.context.getRankedClusterMembers(cluster)
+        else:
+            members = self.context.getClusterMembers(cluster)
+            members[:] = members[self.permutation[index, :len(members)]]
+        return clusters
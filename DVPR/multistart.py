@@ -0,0 +1,73 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .instrumentation import metrics
+
+class SharedArray:
+    """
+    A copy of an array in a shared memory block. It pickles as the name of the block, so the
+    pool workers map the same memory instead of each receiving a copy of the array. The
+    process that created it releases the block once the workers are done.
+    """
+    def __init__(self, array:np.ndarray):
+        self.shape, self.dtype = array.shape, array.dtype
+        self.memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.owner = True
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.memory.buf)
+        self.array[...] = array
+
+    def __getstate__(self):
+        return (self.memory.name, self.shape, self.dtype)
+
+    def __setstate__(self, state):
+        name, self.shape, self.dtype = state
+        self.memory = shared_memory.SharedMemory(name=name)
+        self.owner = False
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.memory.buf)
+
+    def release(self):
+        """
+        Brief:
+            unmap the block, and free it in the creating process
+        """
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+def trajectorySeeds(masterSeed:int, numStart:int) -> list:
+    """
+    Brief:
+        derive independent seeds of the trajectories from a master seed
+    Args:
+        masterSeed: the master seed, None to draw one from the OS entropy
+        numStart: the number of trajectories
+    Returns:
+        seeds (list) : one int seed per trajectory, the same for the same master seed
+    """
+    children = np.random.SeedSequence(masterSeed).spawn(numStart)
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in children]
+
+def initTrajectoryWorker():
+    """
+    Brief:
+        start a pool worker with empty metrics, a forked one inherits the series of its parent
+    """
+    metrics.drain()
+
+def runTrajectoryWorker(scheduler, context, distanceMatrix:SharedArray, seeds:list):
+    """
+    Brief:
+        run trajectories of a request in a pool worker. The context comes without its
+        distance matrix, which the worker maps from shared memory for the task and only reads
+    Returns:
+        results (list) : the result of RouteScheduler.runTrajectory of each seed
+        metrics (dict) : the metrics the trajectories recorded, to merge in the parent
+    """
+    context.distanceMatrix = distanceMatrix.array
+    try:
+        return [scheduler.runTrajectory(context, seed) for seed in seeds], metrics.drain()
+    finally:
+        context.distanceMatrix = None
+        distanceMatrix.release()
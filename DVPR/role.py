@@ -7,156 +7,102 @@ from interface_pb2 import (
     ScheduleReply as ScheduleReply_pb2,
 )
 
+from .catalog import ItemCatalog
+
 class Supplier:
-    def __init__(self, id:int, items:dict = None):
+    """
+    A view of one supplier over the arrays of a ScheduleContext, for the places that
+    still want object access. The scheduler itself only works on supplier ids.
+    """
+    __slots__ = ("context", "id")
+
+    def __init__(self, context, id:int):
+        self.context = context
         self.id = id
-        self.items = items if items is not None else {}
-        self.clusterCenter = None
-        self.distanceToClusterCenter = float("inf")
-        self.clusterMembers = []
-        self.aroundSuppliers = []
-        self.aroundRiders = []
-        self.aroundScope = 0
-        self.clusterItems = {}
-        for item in list(self.items.keys()):
-            if self.items[item] <= 0.0:
-                del self.items[item]
-        self.priority = None
-
-    def addItem(self, item:str, amount:float):
-        self.items[item] = amount
-
-    def setCenter(self):
-        self.clusterCenter = self
-        self.distanceToClusterCenter = 0
-        self.addClusterMember(self)
-
-    def setCluster(self, cluster, distance:float):
-        self.clusterCenter = cluster # the center supplier id of the cluster
-        self.distanceToClusterCenter = distance # the distance to the center supplier
-        cluster.addClusterMember(self)
-
-    def addClusterMember(self, supplier):
-        self.clusterMembers.append(supplier)
-        for item in supplier.items:
-            self.clusterItems[item] = self.clusterItems.get(item, 0) + supplier.items[item]
-
-    def removeClusterMember(self, supplier):
-        self.clusterMembers.remove(supplier)
-        for item in supplier.items:
-            self.clusterItems[item] = self.clusterItems.get(item, 0) - supplier.items[item]
-
-    def updateClusterIfCloser(self, cluster, distance:float):
-        """
-        update the cluster center to new cluster if the distance is smaller
-        """
-        if self.distanceToClusterCenter > distance:
-            if self.clusterCenter is not None:
-                self.clusterCenter.removeClusterMember(self)
-            self.setCluster(cluster, distance)
 
-    def setAroundScope(self, scope:float):
-        """
-        set the scope of the around supplier
-        """
-        self.aroundScope = scope
+    @property
+    def items(self) -> dict:
+        return self.context.catalog.toDict(self.context.supply[self.id])
+
+    @property
+    def clusterItems(self) -> dict:
+        if not self.isClusterCenter():
+            return {}
+        return self.context.catalog.toDict(self.context.clusterSupply[self.id])
 
+    @property
+    def clusterCenter(self):
+        centerId = self.context.clusterOf[self.id]
+        return Supplier(self.context, centerId) if centerId > 0 else None
 
-    def setDistanceToOrder(self, distance:float):
-        self.distanceToOrder = distance
+    @property
+    def distanceToClusterCenter(self) -> float:
+        return self.context.distanceToClusterCenter[self.id]
 
-    def addAroundSupplier(self, supplier):
-        """
-        add around supplier
-        """
-        self.aroundSuppliers.append(supplier)
+    @property
+    def clusterMembers(self) -> list:
+        if not self.isClusterCenter():
+            return []
+        return [Supplier(self.context, id) for id in self.context.getClusterMembers(self.context.clusterIndex[self.id]).tolist()]
 
-    def addAroundRider(self, rider, distance:float):
-        """
-        add around rider id
-        """
-        self.aroundRiders.append((rider, distance))
+    @property
+    def aroundSuppliers(self) -> list:
+        return [Supplier(self.context, id) for id in self.context.getAroundSuppliers(self.id).tolist()]
+
+    @property
+    def aroundRiders(self) -> list:
+        riderIds, distances = self.context.getAroundRiders(self.id)
+        return [(Rider(self.context, id) if id > 0 else None, distance) for id, distance in zip(riderIds.tolist(), distances.tolist())]
+
+    @property
+    def aroundScope(self) -> float:
+        return self.context.aroundScope
+
+    @property
+    def distanceToOrder(self) -> float:
+        return self.context.distanceToOrder[self.id]
+
+    @property
+    def priority(self):
+        if self.isClusterCenter() and len(self.context.clusterPriority) > 0:
+            return self.context.clusterPriority[self.context.clusterIndex[self.id]]
+        priority = self.context.supplierPriority[self.id]
+        return None if np.isnan(priority) else priority
 
     def getNearestRider(self):
         """
         get the nearest rider
         """
-        if len(self.aroundRiders) == 0:
-            return None
-        return min(self.aroundRiders, key=lambda x: x[1])[0]
+        riderId = self.context.nearestRider[self.id]
+        return Rider(self.context, riderId) if riderId > 0 else None
 
     def getNearestRiderDistance(self):
         """
         get the nearest rider
         """
-        if len(self.aroundRiders) == 0:
+        if self.context.nearestRider[self.id] < 0:
             return None
-        return min(self.aroundRiders, key=lambda x: x[1])[1]
-
-    def getClusterPriority(self, requestItems:dict, alpha:float = 0.1) -> float:
-        """
-        get the priority of the supplier
-        Args:
-            requestItems: the items that the rider wants to buy
-            alpha: the bigger alpha, the more prosperous cluster will be preferred
-        """
-        if not self.isClusterCenter():
-            if not self.isClustered():
-                return self.getPriority(requestItems)
-            else:
-                return self.clusterCenter.getClusterPriority(requestItems)
-        priority = 0
-        priority -= self.distanceToOrder # tend to choose the supplier with the shortest distance to order
-        priority -= self.getNearestRiderDistance() # tend to choose the supplier with the shortest distance to nearest rider
-        priority *= (1 + alpha*np.exp(-len(self.aroundRiders) - len(self.aroundSuppliers))) # tend to choose the supplier with more around suppliers and riders
-        priority *= np.sum((1 + alpha*np.exp(-np.array([self.clusterItems[item] for item in requestItems.keys() if item in self.clusterItems])))) # tend to choose the supplier with more items
-        if self.isClusterCenter():
-            self.priority = priority
-        return priority
-
-    def getPriority(self, requestItems:dict, alpha:float = 0.1) -> float:
-        """
-        get the priority of the supplier
-        Args:
-            requestItems: the items that the rider wants to buy
-            alpha: the bigger alpha, the more prosperous supplier will be preferred
-        """
-        priority = 0
-        priority -= self.distanceToOrder # tend to choose the supplier with the shortest distance to order
-        priority -= self.getNearestRiderDistance() # tend to choose the supplier with the shortest distance to nearest rider
-        priority *= (1 + alpha*np.exp(-len(self.aroundRiders) - len(self.aroundSuppliers))) # tend to choose the supplier with more around suppliers and riders
-        priority *= np.sum((1 + alpha*np.exp(-np.array([self.items[item] for item in requestItems.keys() if item in self.items])))) # tend to choose the supplier with more items
-        if not self.isClusterCenter():
-            self.priority = priority
-        return priority
+        return self.context.nearestRiderDistance[self.id]
 
     def isClusterCenter(self):
-        return self.isClustered() and self.clusterCenter.id == self.id
+        return self.isClustered() and self.context.clusterOf[self.id] == self.id
 
     def isClustered(self):
-        return self.clusterCenter != None
+        return self.context.clusterOf[self.id] > 0
 
     def __str__(self) -> str:
         return "Supplier {}, Cluster {}, Items {}, AroundSupplier {}, AroundRiders {}, DistanceToOrder {}, DistanceToNearestRider {}, Priority {}".format(
             self.id,
             self.clusterCenter.id if self.isClustered() else "None",
-            self.items, [supplier.id for supplier in self.aroundSuppliers],
-            [rider.id for rider, distance in self.aroundRiders],
+            self.items, self.context.getAroundSuppliers(self.id).tolist(),
+            self.context.getAroundRiders(self.id)[0].tolist(),
             self.distanceToOrder,
             self.getNearestRiderDistance(),
             self.priority
             )
 
     def __repr__(self) -> str:
-        return "Supplier {}, Cluster {}, Items {}, AroundSupplier {}, AroundRiders {}, DistanceToOrder {}, DistanceToNearestRider {}, Priority {}".format(
-            self.id,
-            self.clusterCenter.id if self.isClustered() else "None",
-            self.items, [supplier.id for supplier in self.aroundSuppliers],
-            [rider.id for rider, distance in self.aroundRiders],
-            self.distanceToOrder,
-            self.getNearestRiderDistance(),
-            self.priority
-            )
+        return self.__str__()
 
     def __eq__(self, other:object):
         if other is None:
@@ -166,87 +112,86 @@ class Supplier:
 
 
 class Rider:
-    def __init__(self, id:int, responseId:int):
+    """
+    A view of one rider over the arrays of a ScheduleContext.
+    """
+    __slots__ = ("context", "id")
+
+    def __init__(self, context, id:int):
+        self.context = context
         self.id = id
-        self.nearestSupplier = None
-        self.responseId = responseId
 
-    def setNearestSupplier(self, supplier:Supplier, distance:float):
-        self.nearestSupplier = supplier
-        self.distanceToNearestSupplier = distance
+    @property
+    def responseId(self) -> int:
+        return self.id - self.context.numSupplier
+
+    @property
+    def nearestSupplier(self):
+        supplierId = self.context.riderNearestSupplier[self.id]
+        return Supplier(self.context, supplierId) if supplierId > 0 else None
+
+    @property
+    def distanceToNearestSupplier(self) -> float:
+        return self.context.riderNearestDistance[self.id]
 
     def __str__(self) -> str:
         return "Rider {}, Nearest Supplier {}".format(self.id, self.nearestSupplier.id if self.nearestSupplier is not None else "None")
 
     def __repr__(self) -> str:
-        return "Rider {}, Nearest Supplier {}".format(self.id, self.nearestSupplier.id if self.nearestSupplier is not None else "None")
+        return self.__str__()
 
 class Order:
-    def __init__(self, id:int, items:dict = None):
+    def __init__(self, id:int, demand:np.ndarray, catalog:ItemCatalog):
         self.id = id
-        self.items = items if items is not None else {}
-        for item in list(self.items.keys()):
-            if self.items[item] <= 0.0:
-                del self.items[item]
+        self.demand = demand # the requested amount of each item in the catalog
+        self.catalog = catalog
+        self.itemIds = np.flatnonzero(demand > 0) # the requested items
+        self.need = demand[self.itemIds] # the requested amount of each requested item
+
+    @property
+    def items(self) -> dict:
+        return self.catalog.toDict(self.need, self.itemIds)
 
 class Route:
     def __init__(self, order:Order):
 
         self.rider = None
-        self.suppliers = []
+        self.supplierIds = np.zeros(0, dtype=np.int64) # the accepted suppliers in visiting order
+        self.itemlists = np.zeros((0, len(order.itemIds))) # the amount of each requested item taken from each accepted supplier
         self.num_suppliers = 0
         self.order = order
-        self.totalItems = {}
-        self.itemsForEachSupplier = {}
+        self.totalItems = np.zeros(len(order.itemIds)) # the supplied amount of each requested item
         self.cost = float("inf")
         self.numSupplierEachCluster = {}
 
     def setRider(self, rider:Rider):
         self.rider = rider
 
-    def addSupplier(self, supplier:Supplier):
+    def setSuppliers(self, supplierIds:np.ndarray, itemlists:np.ndarray, clusterIds:np.ndarray):
         """
         Brief:
-            add supplier for this route
+            set the accepted suppliers of this route
         Args:
-            supplier: the supplier to be added
-        Return:
-            (bool) : True if the supplier is added, False if not
+            supplierIds: the accepted suppliers in visiting order
+            itemlists: the amount of each requested item taken from each supplier
+            clusterIds: the cluster center of each supplier
         """
-        itemlist = {}
-        if self.isEnoughSuppliers():
-            return False
-        for item in self.order.items:
-            self.totalItems[item] = self.totalItems.get(item, 0)
-            if self.totalItems[item] > self.order.items[item]:
-                itemlist[item] = 0
-            else:
-                if self.totalItems[item] + supplier.items.get(item, 0) > self.order.items[item]:
-                    itemlist[item] = self.order.items[item] - self.totalItems[item]
-                else:
-                    itemlist[item] = supplier.items.get(item, 0)
-            self.totalItems[item] += supplier.items.get(item, 0)
-
-        if sum(itemlist.values()) > 0:
-            self.itemsForEachSupplier[supplier.id] = itemlist
-            self.suppliers.append(supplier)
-            self.numSupplierEachCluster[supplier.clusterCenter.id] = self.numSupplierEachCluster.get(supplier.clusterCenter.id, 0) + 1
-            self.num_suppliers += 1
-            return True
+        self.supplierIds = supplierIds
+        self.itemlists = itemlists
+        self.num_suppliers = len(supplierIds)
+        centers, counts = np.unique(clusterIds, return_counts=True)
+        self.numSupplierEachCluster = dict(zip(centers.tolist(), counts.tolist()))
 
     def isEnoughSuppliers(self):
-        for item in self.order.items:
-            if self.totalItems.get(item, 0) < self.order.items[item]:
-                return False
-        return True
+        return bool(np.all(self.totalItems >= self.order.need))
 
     def generateResponse(self):
         response = ScheduleReply_pb2()
         if self.rider is not None:
             response.deliverer_id = self.rider.responseId
-        for supplier in self.suppliers[:self.num_suppliers]:
-            tmp_itemlist = ItemList_pb2(items=self.itemsForEachSupplier[supplier.id])
-            tmp_route = Route_pb2(supplier_id=supplier.id, itemlist=tmp_itemlist)
+        for supplierId, itemlist in zip(self.supplierIds[:self.num_suppliers].tolist(), self.itemlists):
+            tmp_itemlist = ItemList_pb2(items=self.order.catalog.toDict(itemlist, self.order.itemIds))
+            tmp_route = Route_pb2(supplier_id=supplierId, itemlist=tmp_itemlist)
             response.route.append(tmp_route)
         return response
 
@@ -257,17 +202,10 @@ class Route:
         return "Route: Rider {}, Order {}, NumSuppliers {}, TotalItems {}, Suppliers {}, Cost {}".format(
             self.rider.id if self.rider is not None else "None",
             (self.order.id,self.order.items),
-            self.num_suppliers, self.totalItems,
-            [itemlist for itemlist in self.itemsForEachSupplier.items()],
+            self.num_suppliers, self.order.catalog.toDict(self.totalItems, self.order.itemIds),
+            [(supplierId, self.order.catalog.toDict(itemlist, self.order.itemIds)) for supplierId, itemlist in zip(self.supplierIds.tolist(), self.itemlists)],
             self.cost,
             )
 
     def __repr__(self) -> str:
-        return "Route: Rider {}, Order {}, NumSuppliers {}, TotalItems {}, Suppliers {}, Cost {}".format(
-            self.rider.id if self.rider is not None else "None",
-            (self.order.id,self.order.items),
-            self.num_suppliers, self.totalItems,
-            [itemlist for itemlist in self.itemsForEachSupplier.items()],
-            self.cost,
-            )
-
+        return self.__str__()
@@ -1,259 +1,1009 @@
 import numpy as np
-from typing import List, Tuple
+import logging
+import multiprocessing
 import random
-
-from .role import Supplier, Rider, Order, Route
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent import futures
+
+from .role import Rider, Order, Route
+from .distance import buildDistanceMatrix, setOrderDistances
+from .context import ScheduleContext, sliceIndices
+from .catalog import ItemCatalog, buildSupplyMatrix
+from .incremental import RouteBuilder, allocateItems
+from .exact import solveExact, MAX_EXACT_SUPPLIERS
+from .sequencing import sequencePath
+from .moves import MoveBatch
+from .multistart import SharedArray, trajectorySeeds, initTrajectoryWorker, runTrajectoryWorker
+from .instrumentation import metrics, COUNT_BUCKETS, RATIO_BUCKETS
+
+logger = logging.getLogger(__name__)
 
 class RouteScheduler:
 
-    def __init__(self, aroundScope:float = 100.0, maxIteration:int = 100):
+    def __init__(self, aroundScope:float = 100.0, maxIteration:int = 100, timeBudget:float = None, maxStallIteration:int = None,
+                 numStart:int = 1, numWorkers:int = 1, seed:int = None, sequencing:bool = True, exactThreshold:int = 12,
+                 pruneSuppliers:bool = True, candidatesPerItem:int = None, memoSize:int = 1024, tabuTenure:int = 8, maxRedraw:int = 8,
+                 batchSize:int = 1, distanceDtype = np.float64):
+        """
+        Args:
+            aroundScope: the distance within which suppliers are around each other
+            maxIteration: the maximum number of local search iterations, None for no limit
+            timeBudget: the seconds a scheduling call may take when the caller gives no deadline, None for no limit
+            maxStallIteration: stop the local search after this many iterations without improvement, None for no limit
+            numStart: the number of independent search trajectories, the best route of them is returned
+            numWorkers: the number of processes running the trajectories, 1 to run them in this process.
+                The process pool is started on the first search and kept until close(). Its
+                workers import the main module, so a script has to guard its own code with
+                if __name__ == "__main__"
+            seed: the master seed of the local search, None to use the global random module
+            sequencing: reorder the visits of the chosen suppliers and pick the best rider for them
+            exactThreshold: solve the orders with at most this many relevant suppliers exactly, None to always search.
+                At most MAX_EXACT_SUPPLIERS (16), the memory of the exact solver doubles with each supplier
+            pruneSuppliers: only build the neighborhoods and clusters over the suppliers with some requested item
+            candidatesPerItem: also keep only this many suppliers of each requested item, the nearest to
+                the order, when they can satisfy it. None to keep all of them
+            memoSize: the number of evaluated rankings the local search remembers, 0 to disable
+            tabuTenure: the number of recent cluster swaps the local search won't try again, 0 to disable
+            maxRedraw: the number of times a local search iteration draws another move when
+                the drawn one is tabu or already evaluated
+            batchSize: the number of moves the local search draws and scores at once in each step
+            distanceDtype: the storage type of the distance matrix, np.float32 halves its memory
+                and rounds the distances to 7 significant digits, the costs are still summed in float64
+        """
+        if maxIteration is None and timeBudget is None and maxStallIteration is None:
+            raise ValueError("The local search needs an iteration limit, a time budget or a stall limit")
+        if numStart < 1 or numWorkers < 1 or batchSize < 1:
+            raise ValueError("The local search needs at least one trajectory, one worker and one move per step")
+        if exactThreshold is not None and exactThreshold > MAX_EXACT_SUPPLIERS:
+            raise ValueError("The exact threshold can't exceed {} suppliers".format(MAX_EXACT_SUPPLIERS))
         self.aroundScope = aroundScope
         self.maxIteration = maxIteration
-        self.clusters = []
+        self.timeBudget = timeBudget
+        self.maxStallIteration = maxStallIteration
+        self.numStart = numStart
+        self.numWorkers = numWorkers
+        self.seed = seed
+        self.sequencing = sequencing
+        self.exactThreshold = exactThreshold
+        self.pruneSuppliers = pruneSuppliers
+        self.candidatesPerItem = candidatesPerItem
+        self.memoSize = memoSize
+        self.tabuTenure = tabuTenure
+        self.maxRedraw = maxRedraw
+        self.batchSize = batchSize
+        self.distanceDtype = distanceDtype
+        self.pool = None
+        self.poolLock = threading.Lock()
+
+    def __getstate__(self):
+        # the copies sent to the pool workers leave the pool behind
+        state = self.__dict__.copy()
+        state.update(pool=None, poolLock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.poolLock = threading.Lock()
+
+    def workerPool(self) -> futures.ProcessPoolExecutor:
+        """
+        Brief:
+            return the process pool of the trajectories, starting it on the first call. Its
+            workers are forked from a forkserver, so the pool can be started from a
+            multithreaded process like the gRPC server, and it is shared by the calls of all threads
+        """
+        with self.poolLock:
+            if self.pool is None:
+                self.pool = futures.ProcessPoolExecutor(max_workers=self.numWorkers, mp_context=multiprocessing.get_context("forkserver"),
+                                                       initializer=initTrajectoryWorker)
+                # in a pool worker, shut the pool down before the exit joins its processes, and
+                # before the finalizers of priority 10 close the queues the shutdown goes through
+                multiprocessing.util.Finalize(self.pool, self.pool.shutdown, exitpriority=20)
+            return self.pool
+
+    def close(self):
+        """
+        Brief:
+            shut the process pool of the trajectories down, a later search starts a new one
+        """
+        with self.poolLock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def getDeadline(self, deadline:float = None):
+        """
+        Brief:
+            return the deadline of a scheduling call starting now
+        Args:
+            deadline: the deadline given by the caller, in time.monotonic() seconds
+        Returns:
+            deadline (float) : the earlier of the given deadline and the time budget, None if neither is set
+        """
+        if self.timeBudget is not None:
+            budgetDeadline = time.monotonic() + self.timeBudget
+            deadline = budgetDeadline if deadline is None else min(deadline, budgetDeadline)
+        return deadline
 
-    def initializeFromRequest(self, request):
+    def initializeFromRequest(self, request, catalog:ItemCatalog = None, candidateItems:np.ndarray = None,
+                              previous:ScheduleContext = None, distances:np.ndarray = None) -> ScheduleContext:
         """
         Brief:
             initialize the request from the request object
+        Args:
+            request: pg2 request object
+            catalog: the item catalog to intern the item names into, a new one by default
+            candidateItems: the item ids the candidate suppliers are selected for, the items
+                of the order by default
+            previous: the context of the previous request over the same suppliers, to keep
+                its clusters where the neighborhoods didn't change and to start the search
+                from its best route. Ignored if the number of suppliers changed
+            distances: the distance vector of the request already converted by
+                toDistanceVector, e.g. to compute its cache key, None to convert it here
+        Returns:
+            context (ScheduleContext) : the scheduling state of this request
+        """
+        logger.debug("Initialize from request")
+        with metrics.timer("phase_seconds", phase="ingest"):
+            catalog = catalog if catalog is not None else ItemCatalog()
+            orderItems = dict(request.request.items)
+            for item in orderItems:
+                catalog.intern(item)
+            supply = buildSupplyMatrix([item.items for item in request.itemlists], catalog)
+            order = Order(0, catalog.toVector(orderItems), catalog)
+            numSupplier = len(request.itemlists)
+            numRider = request.num_deliverer
+            distances = request.distance if distances is None else distances
+            distanceMatrix = buildDistanceMatrix(distances, numSupplier, numRider, self.distanceDtype)
+            context = ScheduleContext(order, numSupplier, numRider, distanceMatrix, catalog, supply, self.aroundScope)
+        if previous is not None and (previous.numSupplier != numSupplier or previous.aroundScope != self.aroundScope):
+            previous = None
+        if self.pruneSuppliers:
+            with metrics.timer("phase_seconds", phase="candidates"):
+                context.supplierIds = self.selectCandidates(context, candidateItems)
+
+        with metrics.timer("phase_seconds", phase="neighborhood"):
+            # the candidate suppliers within aroundScope of each candidate supplier, excluding itself
+            supplierIds = context.supplierIds
+            around = context.distanceMatrix[np.ix_(supplierIds, supplierIds)] <= self.aroundScope
+            np.fill_diagonal(around, False)
+            rows, cols = np.nonzero(around)
+            context.aroundIds = supplierIds[cols]
+            context.aroundIndptr = np.concatenate([[0], np.cumsum(np.bincount(supplierIds[rows], minlength=numSupplier + 1))])
+            self.setAroundRiders(context)
+
+        with metrics.timer("phase_seconds", phase="clustering"):
+            self.clusterSuppliers(context, previous)
+        if previous is not None and previous.best_route is not None:
+            context.warmRoute = previous.best_route.supplierIds
+        return context
+
+    def selectCandidates(self, context:ScheduleContext, itemIds:np.ndarray = None) -> np.ndarray:
+        """
+        Brief:
+            Select the suppliers the neighborhoods, the clusters and the search work on: the
+            ones with some stock of the requested items. For a single order, the order is
+            rejected up front when the total stock can't satisfy it, and with
+            candidatesPerItem only the suppliers nearest to the order of each item are kept
+            if they can still satisfy it.
+        Args:
+            context: the scheduling state of the request
+            itemIds: the item ids to select the suppliers for, the items of the order by
+                default. Other item sets, like the items of a batch, skip the order checks
+        Returns:
+            supplierIds (np.ndarray) : the candidate supplier ids in increasing order, empty
+                if the order can't be satisfied
+        """
+        supplierIds = np.arange(1, context.numSupplier + 1)
+        isOrder = itemIds is None
+        itemIds = context.order.itemIds if isOrder else itemIds
+        stock = context.supply[1:, itemIds]
+        holders = stock > 0 # supplier x item
+        relevant = holders.any(axis=1)
+        if not isOrder:
+            return supplierIds[relevant]
+
+        # reject the order if all of the stock can't satisfy it
+        if np.any(stock.sum(axis=0) < context.order.need):
+            return supplierIds[:0]
+        if self.candidatesPerItem is None:
+            return supplierIds[relevant]
+
+        # keep the nearest holders of each item, the first supplier wins on ties
+        byDistance = np.argsort(context.distanceToOrder[1:], kind="stable")
+        nearest = np.zeros(context.numSupplier, dtype=bool)
+        for column in range(len(itemIds)):
+            itemHolders = byDistance[holders[byDistance, column]]
+            nearest[itemHolders[:self.candidatesPerItem]] = True
+        if np.any(stock[nearest].sum(axis=0) < context.order.need):
+            return supplierIds[relevant]
+        return supplierIds[nearest]
+
+    def setAroundRiders(self, context:ScheduleContext):
+        """
+        Brief:
+            attach each free rider to its nearest supplier, and give every supplier left
+            without a rider its nearest rider
+        Args:
+            context: the scheduling state of the request
+        """
+        supplierIds = context.supplierIds
+        riders = context.freeRiders
+        context.riderNearestSupplier[:] = -1
+        context.riderNearestDistance[:] = np.inf
+        if len(riders) == 0 or len(supplierIds) == 0:
+            context.aroundRiderIndptr = np.concatenate([[0], np.cumsum(np.bincount(supplierIds, minlength=context.numSupplier + 1))])
+            context.aroundRiderIds = np.full(len(supplierIds), -1, dtype=np.int64)
+            context.aroundRiderDistances = np.full(len(supplierIds), np.inf)
+            context.nearestRider[:] = -1
+            context.nearestRiderDistance[:] = np.inf
+            return
+
+        # set the nearest supplier of each rider, the first one wins on ties
+        riderToSupplier = context.getDistances(riders, supplierIds)
+        nearestSupplierIndex = np.argmin(riderToSupplier, axis=1)
+        nearestSupplierDistance = riderToSupplier[np.arange(len(riders)), nearestSupplierIndex]
+        context.riderNearestSupplier[riders] = supplierIds[nearestSupplierIndex]
+        context.riderNearestDistance[riders] = nearestSupplierDistance
+
+        # set the nearest rider of the suppliers without any around rider, the last one wins on ties
+        lonely = np.flatnonzero(np.bincount(nearestSupplierIndex, minlength=len(supplierIds)) == 0)
+        supplierToRider = riderToSupplier[:, lonely].T
+        nearestRiderIndex = len(riders) - 1 - np.argmin(supplierToRider[:, ::-1], axis=1)
+        nearestRiderDistance = supplierToRider[np.arange(len(lonely)), nearestRiderIndex]
+
+        # group the around riders by supplier, keeping the riders of a supplier in id order
+        entrySupplier = np.concatenate([nearestSupplierIndex, lonely])
+        entryRider = np.concatenate([riders, riders[nearestRiderIndex]])
+        entryDistance = np.concatenate([nearestSupplierDistance, nearestRiderDistance])
+        entries = np.argsort(entrySupplier, kind="stable")
+        context.aroundRiderIds = entryRider[entries]
+        context.aroundRiderDistances = entryDistance[entries]
+        context.aroundRiderIndptr = np.concatenate([[0], np.cumsum(np.bincount(supplierIds[entrySupplier], minlength=context.numSupplier + 1))])
+
+        # the nearest around rider of each supplier, the first one wins on ties
+        nearest = np.lexsort((np.arange(len(entries)), context.aroundRiderDistances, entrySupplier[entries]))
+        nearest = nearest[context.aroundRiderIndptr[supplierIds]]
+        context.nearestRider[supplierIds] = context.aroundRiderIds[nearest]
+        context.nearestRiderDistance[supplierIds] = context.aroundRiderDistances[nearest]
+
+    def setOrder(self, context:ScheduleContext, request):
+        """
+        Brief:
+            replace the order of the context with the order of another request on the same suppliers and riders
+        Args:
+            context: the scheduling state built from a request of the same batch
+            request: pg2 request object
+        """
+        if len(request.itemlists) != context.numSupplier:
+            raise ValueError("The requests of a batch should share the same suppliers")
+        context.order = Order(0, context.catalog.toVector(dict(request.request.items)), context.catalog)
+        context.distanceToOrder[1:] = setOrderDistances(context.distanceMatrix, request.distance, context.numSupplier)
+        context.supplierPriority[:] = np.nan
+        context.clusterPriority = np.zeros(0)
+        context.best_route = None
+        context.routeBuilder = None
+
+    def assignRoute(self, context:ScheduleContext, route:Route):
         """
-        print("--- Initialize from request ---")
-        self.clusters = []
-        self.order = Order(0, dict(request.request.items))
-        self.suppliers = [Supplier(index + 1, dict(item.items)) for index, item in enumerate(list(request.itemlists))]
-        self.numRider = request.num_deliverer
-        self.riders = [Rider(index + len(self.suppliers) + 1, index + 1) for index in range(self.numRider)]
-        self.distances = list(request.distance)
-
-        dict_suppliers = {}
-        for supplier in self.suppliers:
-            dict_suppliers[supplier.id] = supplier
-        self.suppliers = dict_suppliers
-
-        dict_riders = {}
-        for rider in self.riders:
-            dict_riders[rider.id] = rider
-        self.riders = dict_riders
-
-
-        for supplier1 in self.suppliers.values():
-            supplier1.setAroundScope(self.aroundScope)
-            supplier1.setDistanceToOrder(self.getDistance(supplier1.id, self.order.id))
-            # cluster suppliers
-            for supplier2 in self.suppliers.values():
-                if supplier1.id == supplier2.id:
-                    continue
-                if self.getDistance(supplier1.id, supplier2.id) <= self.aroundScope:
-                    supplier1.addAroundSupplier(supplier2)
-        # # set the nearest rider around each supplier
-
-        for rider in self.riders.values():
-            nearestSupplier = None
-            nearestDistance = float('inf')
-
-            for supplier in self.suppliers.values():
-
-                if nearestSupplier == None:
-                    nearestSupplier = supplier
-                    nearestDistance = self.getDistance(rider.id, supplier.id)
-                else:
-                    if self.getDistance(rider.id, supplier.id) < nearestDistance:
-                        nearestSupplier = supplier
-                        nearestDistance = self.getDistance(rider.id, supplier.id)
-            rider.setNearestSupplier(nearestSupplier, nearestDistance)
-            nearestSupplier.addAroundRider(rider, nearestDistance)
-
-        for supplier in self.suppliers.values():
-            if len(supplier.aroundRiders) == 0:
-                nearestRider = None
-                nearestDistance = float('inf')
-                for rider in self.riders.values():
-                    if nearestRider == None:
-                        nearestRider = rider
-                        nearestDistance = self.getDistance(supplier.id, rider.id)
-                    else:
-                        if self.getDistance(supplier.id, rider.id) <= nearestDistance:
-                            nearestRider = rider
-                            nearestDistance = self.getDistance(supplier.id, rider.id)
-                supplier.addAroundRider(nearestRider, nearestDistance)
-
-        self.clusterSuppliers()
-
-    def scheduleRoute(self,request):
+        Brief:
+            take the items of the route out of the supplier stock and its rider out of the free riders
+        Args:
+            context: the scheduling state of the batch
+            route: the scheduled route
+        """
+        itemIds = route.order.itemIds
+        context.supply[np.ix_(route.supplierIds, itemIds)] -= route.itemlists
+        np.subtract.at(context.clusterSupply, (context.clusterOf[route.supplierIds][:, None], itemIds[None, :]), route.itemlists)
+        context.freeRiders = context.freeRiders[context.freeRiders != route.rider.id]
+        self.setAroundRiders(context)
+
+    def scheduleRoute(self,request, deadline:float = None):
         """
         Brief:
             Schedule a route for the given request.
+            All of the request state lives in a ScheduleContext, so this method is reentrant.
         Args:
             request: pg2 request object
+            deadline: stop the local search at this time.monotonic() and return the best route so far
         Returns:
             response (scheduleReply) : the generated schedule route reply result
         """
-        # read the request
-        self.initializeFromRequest(request)
-
-        print("--- Suppliers ---")
-        for supplier in self.suppliers.values(): # debug
-            print(supplier) # debug
-        print("--- Riders ---")
-        for rider in self.riders.values():
-            print(rider)
+        response, _ = self.scheduleIncremental(request, None, deadline)
+        return response
 
-        initialRoute = self.greedyInitialization()
+    def scheduleIncremental(self, request, previous:ScheduleContext = None, deadline:float = None, distances:np.ndarray = None):
+        """
+        Brief:
+            Schedule a route for a request whose snapshot changed a little since the previous
+            one, e.g. a few stock changes, riders or a new order near the last one. The clusters
+            of the previous request are kept where the neighborhoods didn't change, and the
+            search starts from its best route when it beats the greedy one. The caller keeps
+            the returned context for the next request. The previous context is only read, so
+            concurrent requests may start from the same one.
+        Args:
+            request: pg2 request object
+            previous: the context returned for the previous request, None for a cold start
+            deadline: stop the local search at this time.monotonic() and return the best route so far
+            distances: the distance vector of the request already converted by toDistanceVector
+        Returns:
+            response (scheduleReply) : the generated schedule route reply result
+            context (ScheduleContext) : the scheduling state of this request
+        """
+        deadline = self.getDeadline(deadline)
+        with metrics.timer("phase_seconds", phase="schedule"):
+            # read the request
+            context = self.initializeFromRequest(request, previous=previous, distances=distances)
+            context.deadline = deadline
+
+            if logger.isEnabledFor(logging.DEBUG):
+                for supplier in context.suppliers:
+                    logger.debug("%s", supplier)
+                for rider in context.riders:
+                    logger.debug("%s", rider)
+
+            route = self.searchRoute(context)
+        metrics.increment("requests", outcome="empty" if route is None else "routed")
         # if all of the current suppliers can't satisfy the order, return a empty schedule
+        response = Route(context.order).generateResponse() if route is None else route.generateResponse()
+        return response, context
+
+    def scheduleBatch(self, requests:list, deadline:float = None) -> list:
+        """
+        Brief:
+            Schedule the orders collected in one window over the same suppliers and riders.
+            The neighborhoods and clusters are built once from the first request. The orders
+            are then scheduled one after another in the given order, and each route takes its
+            items out of the shared supplier stock and its rider out of the free riders, so
+            no rider takes two orders and no stock is promised twice.
+        Args:
+            requests: pg2 request objects sharing itemlists, num_deliverer and the supplier and
+                rider distances, they only differ in the order and its distances to the suppliers
+            deadline: the time.monotonic() deadline of the whole batch, the remaining time is
+                shared evenly by the orders left
+        Returns:
+            responses (list) : the schedule reply of each request, empty if it can't be satisfied
+        """
+        if len(requests) == 0:
+            return []
+        deadline = self.getDeadline(deadline)
+        # intern the items of every order first, so the supply matrix covers all of them
+        catalog = ItemCatalog(item for request in requests for item in request.request.items)
+        # the candidate suppliers are the ones with an item of any of the orders
+        context = self.initializeFromRequest(requests[0], catalog, np.arange(len(catalog)))
+        responses = []
+        for index, request in enumerate(requests):
+            if index > 0:
+                self.setOrder(context, request)
+            if deadline is not None:
+                now = time.monotonic()
+                context.deadline = now + max(deadline - now, 0) / (len(requests) - index)
+            route = self.searchRoute(context)
+            if route is None:
+                responses.append(Route(context.order).generateResponse())
+                continue
+            self.assignRoute(context, route)
+            responses.append(route.generateResponse())
+        return responses
+
+    def searchRoute(self, context:ScheduleContext):
+        """
+        Brief:
+            Run the greedy initialization and the local search on the order of the context,
+            then sequence the visits of the chosen suppliers. Orders with at most exactThreshold
+            relevant suppliers are solved exactly instead.
+        Args:
+            context: the scheduling state of the request
+        Returns:
+            route (Route) : the best route found, None if the suppliers can't satisfy the order
+                or no rider is free
+        """
+        if len(context.freeRiders) == 0 or len(context.supplierIds) == 0:
+            return None
+        relevant = self.getRelevantSuppliers(context)
+        if self.exactThreshold is not None and len(relevant) <= self.exactThreshold:
+            with metrics.timer("phase_seconds", phase="exact"):
+                return self.exactSearch(context, relevant)
+        if self.numStart > 1:
+            with metrics.timer("phase_seconds", phase="multistart"):
+                route = self.multiStartSearch(context)
+        else:
+            route = self.singleStartSearch(context)
+        if route is not None and self.sequencing:
+            with metrics.timer("phase_seconds", phase="sequencing"):
+                self.sequenceRoute(context, route)
+        return route
 
+    def getRelevantSuppliers(self, context:ScheduleContext) -> np.ndarray:
+        """
+        Brief:
+            return the suppliers with some stock of the requested items
+        """
+        supplierIds = context.supplierIds
+        return supplierIds[np.any(context.supply[np.ix_(supplierIds, context.order.itemIds)] > 0, axis=1)]
+
+    def exactSearch(self, context:ScheduleContext, supplierIds:np.ndarray):
+        """
+        Brief:
+            Find the optimal route over the given suppliers with a dynamic program over their
+            subsets. The route visits a minimal set of suppliers satisfying the order, in the
+            best order, from the free rider nearest to its first stop.
+        Args:
+            context: the scheduling state of the request
+            supplierIds: the relevant suppliers, a few of them as the work grows as 2^k k^2
+        Returns:
+            route (Route) : the optimal route, None if the suppliers can't satisfy the order
+        """
+        if len(supplierIds) == 0:
+            return None
+        order = context.order
+        supply = context.supply[np.ix_(supplierIds, order.itemIds)]
+        riderToSupplier = context.getDistances(context.freeRiders, supplierIds)
+        result = solveExact(context.getDistances(supplierIds, supplierIds), riderToSupplier.min(axis=0),
+                            context.distanceToOrder[supplierIds], supply, order.need)
+        if result is None:
+            return None
+        cost, visits, totalItems = result
+
+        route = Route(order)
+        route.setRider(Rider(context, int(context.freeRiders[np.argmin(riderToSupplier[:, visits[0]])])))
+        before = np.cumsum(supply[visits], axis=0) - supply[visits]
+        route.setSuppliers(supplierIds[visits], allocateItems(supply[visits], order.need, before), context.clusterOf[supplierIds[visits]])
+        route.totalItems = totalItems
+        route.setCost(cost)
+        context.best_route = route
+        return route
+
+    def singleStartSearch(self, context:ScheduleContext):
+        """
+        Brief:
+            Run one trajectory of greedy initialization and local search, seeded with the
+            master seed if one is set.
+        Args:
+            context: the scheduling state of the request
+        Returns:
+            route (Route) : the best route found, None if the suppliers can't satisfy the order
+        """
+        if self.seed is not None:
+            context.random = random.Random(self.seed)
+        initialRoute = self.greedyInitialization(context)
         if not initialRoute.isEnoughSuppliers():
-            return Route(self.order).generateResponse()
-        self.best_route = initialRoute
+            return None
+        context.best_route = initialRoute
 
-        print("--- initialRoute ---")
-        print(initialRoute) # debug
+        logger.debug("Initial route: %s", initialRoute)
         # do local search
-        self.localSearch()
+        with metrics.timer("phase_seconds", phase="search"):
+            self.localSearch(context)
+        return context.best_route
 
-        return self.best_route.generateResponse()
+    def sequenceRoute(self, context:ScheduleContext, route:Route):
+        """
+        Brief:
+            Reorder the visits of the suppliers chosen by the search with 2-opt and Or-opt
+            moves, and give the route the free rider nearest to its new first stop. The
+            start of the path is a virtual stop whose distance to each supplier is the
+            distance of its nearest free rider, so the moves also pick the first stop.
+        Args:
+            context: the scheduling state of the request
+            route: the route to sequence, updated in place if its cost goes down
+        """
+        supplierIds = route.supplierIds
+        if route.num_suppliers == 0 or len(context.freeRiders) == 0:
+            return
+        riderToSupplier = context.getDistances(context.freeRiders, supplierIds)
+        startDistance = riderToSupplier.min(axis=0)
+        # local indices: 0 the riders, 1..k the suppliers, k+1 the order
+        units = np.concatenate([[route.order.id], supplierIds, [route.order.id]])
+        distances = context.getDistances(units, units)
+        distances[0, :] = distances[:, 0] = np.inf
+        distances[0, 1:-1] = distances[1:-1, 0] = startDistance
+        path = sequencePath(distances, np.arange(len(units)))
+
+        visits = path[1:-1] - 1
+        riderId = int(context.freeRiders[np.argmin(riderToSupplier[:, visits[0]])])
+        cost = float(startDistance[visits[0]] + distances[path[1:-1], path[2:]].sum())
+        if cost < route.cost:
+            route.setRider(Rider(context, riderId))
+            route.setSuppliers(supplierIds[visits], route.itemlists[visits], context.clusterOf[supplierIds[visits]])
+            route.setCost(cost)
+
+    def multiStartSearch(self, context:ScheduleContext):
+        """
+        Brief:
+            Run numStart independent trajectories of greedy initialization and local search,
+            each with its own RNG seeded from the master seed, and keep the best route.
+            With numWorkers > 1 the trajectories run in the process pool of the scheduler, split
+            in one task per worker that receives the context, maps its distance matrix from
+            shared memory and sends back the metrics it recorded. The result only depends on
+            the master seed, not on the number of workers, and the earliest trajectory wins on ties.
+        Args:
+            context: the scheduling state of the request
+        Returns:
+            route (Route) : the best route of all trajectories, None if the suppliers can't
+                satisfy the order
+        """
+        seeds = trajectorySeeds(self.seed, self.numStart)
+        numWorkers = min(self.numWorkers, self.numStart)
+        if numWorkers > 1:
+            pool = self.workerPool()
+            context.best_route = None
+            context.routeBuilder = None
+            distanceMatrix, context.distanceMatrix = context.distanceMatrix, None
+            sharedMatrix = SharedArray(distanceMatrix)
+            try:
+                # contiguous chunks of seeds, so the results come back in the order of the seeds
+                chunkSize = -(-len(seeds) // numWorkers)
+                tasks = [pool.submit(runTrajectoryWorker, self, context, sharedMatrix, seeds[start:start + chunkSize])
+                         for start in range(0, len(seeds), chunkSize)]
+                results = []
+                for task in tasks:
+                    taskResults, workerMetrics = task.result()
+                    results += taskResults
+                    metrics.merge(workerMetrics)
+            finally:
+                context.distanceMatrix = distanceMatrix
+                sharedMatrix.release()
+        else:
+            results = [self.runTrajectory(context, seed) for seed in seeds]
+
+        results = [result for result in results if result is not None]
+        if len(results) == 0:
+            return None
+        context.numIteration += sum(result[-1] for result in results)
+        cost, riderId, supplierIds, itemlists, totalItems, _ = min(results, key=lambda result: result[0])
+        route = Route(context.order)
+        route.setRider(Rider(context, riderId))
+        route.setSuppliers(supplierIds, itemlists, context.clusterOf[supplierIds])
+        route.totalItems = totalItems
+        route.setCost(cost)
+        context.best_route = route
+        return route
 
-    def greedyInitialization(self):
+    def runTrajectory(self, context:ScheduleContext, seed:int):
+        """
+        Brief:
+            run one trajectory of greedy initialization and local search with its own RNG, and
+            restore the cluster ranking of the context afterwards for the next trajectory
+        Args:
+            context: the scheduling state of the request
+            seed: the seed of the trajectory RNG
+        Returns:
+            result (tuple) : (cost, rider id, supplier ids, itemlists, total items, iterations)
+                of the best route, arrays only so it is cheap to send back from a worker,
+                None if the suppliers can't satisfy the order
+        """
+        memberIds, clusterOrder = context.memberIds.copy(), context.clusterOrder
+        numIteration = context.numIteration
+        context.random = random.Random(seed)
+        try:
+            route = self.greedyInitialization(context)
+            if not route.isEnoughSuppliers():
+                return None
+            context.best_route = route
+            self.localSearch(context)
+            route = context.best_route
+            return (route.cost, route.rider.id, route.supplierIds, route.itemlists, route.totalItems, context.numIteration - numIteration)
+        finally:
+            context.memberIds[:] = memberIds
+            context.clusterOrder = clusterOrder
+            context.numIteration = numIteration
+            context.random = None
+
+    def greedyInitialization(self, context:ScheduleContext):
         """
         Brief:
             Compute the initial route schedule with greedy insertion
+        Args:
+            context: the scheduling state of the request
         Return:
             route (Route) : the initial route computed by greedy insertion
         """
 
         # initialize the supplier rank
 
-        print("Greedy initialization...")
-        self.clusters = sorted(self.clusters, key=lambda x: x.getClusterPriority(self.order.items), reverse=True)
-        rankedSuppliers = []
-        for cluster in self.clusters:
-            cluster.clusterMembers = sorted(cluster.clusterMembers, key=lambda x: x.getPriority(self.order.items), reverse=True)
-            rankedSuppliers.extend(cluster.clusterMembers)
-        # # initialize the route
-        route = Route(self.order)
-        route.setRider(rankedSuppliers[0].getNearestRider())
-        # # initialize the route with greedy insertion
-        for supplier in rankedSuppliers:
-            route.addSupplier(supplier)
-        route.setCost(self.EvaluateRoute(route))
-        return route
-
-
-    def getLocalCluster(self):
+        logger.debug("Greedy initialization")
+        with metrics.timer("phase_seconds", phase="greedy"):
+            self.setPriorities(context)
+            context.clusterOrder = context.clusterOrder[np.argsort(-context.clusterPriority[context.clusterOrder], kind="stable")]
+            context.memberIds[:] = context.rankedMemberIds
+            rankedSuppliers = context.getRankedSuppliers(context.clusterOrder)
+            # # initialize the route with greedy insertion
+            context.routeBuilder = RouteBuilder(context)
+            context.routeBuilder.build(rankedSuppliers)
+            if context.warmRoute is not None:
+                self.warmInitialization(context, rankedSuppliers)
+            return context.routeBuilder.toRoute()
+
+    def warmInitialization(self, context:ScheduleContext, rankedSuppliers:np.ndarray):
+        """
+        Brief:
+            Rank the suppliers from the best route of the previous request: the clusters of
+            the route first in visiting order, then the other clusters in priority order.
+            Within a cluster the suppliers of the route come first in visiting order, the
+            others in priority order. The ranking is kept if its route beats the greedy one.
+        Args:
+            context: the scheduling state of the request, with the greedy ranking built
+            rankedSuppliers: the greedy ranking
+        """
+        builder = context.routeBuilder
+        greedyCost = builder.cost
+        numCluster = len(context.clusterCenters)
+        warmRoute = context.warmRoute[context.clusterOf[context.warmRoute] >= 0] # the route suppliers still candidates
+
+        # the rank of each cluster, the other clusters tie and fall back to their priority
+        clusterRank = np.full(numCluster, np.inf)
+        np.minimum.at(clusterRank, context.clusterIndex[context.clusterOf[warmRoute]], np.arange(len(warmRoute)))
+        clusterOrder = np.lexsort((-context.clusterPriority, clusterRank))
+
+        memberRank = np.full(context.numSupplier + 1, np.inf)
+        memberRank[warmRoute] = np.arange(len(warmRoute))
+        members = context.memberIds
+        segment = np.repeat(np.arange(numCluster), np.diff(context.memberIndptr))
+        context.memberIds = members[np.lexsort((-context.supplierPriority[members], memberRank[members], segment))]
+        warmCost = builder.build(context.getRankedSuppliers(clusterOrder))
+        if warmCost < greedyCost:
+            context.clusterOrder = clusterOrder
+            metrics.increment("warm_starts", outcome="previous")
+            return
+        # the greedy ranking is as good, go back to it
+        context.memberIds = members
+        builder.build(rankedSuppliers)
+        metrics.increment("warm_starts", outcome="greedy")
+
+
+    def getLocalCluster(self, context:ScheduleContext):
         """
         Brief:
             do local search for the current clusters rank, generate a new clusters rank and return
+        Args:
+            context: the scheduling state of the request
+        Returns:
+            clusters (np.ndarray) : the new ranked cluster indices
+            move (tuple) : the two swapped cluster indices, None for a reordering of members
+            members (tuple) : (cluster index, its reordered members) for a reordering of members,
+                None for a swap. The members of the context are left untouched
         """
-        clusters = self.clusters.copy()
-        # random.shuffle(clusters)
-        # return clusters
+        rng = context.random if context.random is not None else random
+        clusters = context.clusterOrder.copy()
+        numUsedClusters = len(context.best_route.numSupplierEachCluster)
         # find the cluster that need to be swapped
-        if random.random() < 0.5:
-            cluster1 = random.choice(clusters[:len(self.best_route.numSupplierEachCluster)])
-            if random.random() < 0.5:
-                cluster2 = random.choice(clusters[:len(self.best_route.numSupplierEachCluster)])
+        if rng.random() < 0.5:
+            index1 = rng.randrange(numUsedClusters)
+            if rng.random() < 0.5:
+                index2 = rng.randrange(numUsedClusters)
             else:
-                cluster2 = random.choice(clusters[len(self.best_route.numSupplierEachCluster)-1:])
+                index2 = numUsedClusters - 1 + rng.randrange(len(clusters) - numUsedClusters + 1)
             # swap the cluster
-            index1 = clusters.index(cluster1)
-            index2 = clusters.index(cluster2)
             clusters[index1], clusters[index2] = clusters[index2], clusters[index1]
+            return clusters, (int(min(clusters[index1], clusters[index2])), int(max(clusters[index1], clusters[index2]))), None
         else:
             # if the current Supplier
-            cluster = random.choice(clusters[:len(self.best_route.numSupplierEachCluster)])
-            if random.random() < 0.1:
-                cluster.clusterMembers = sorted(cluster.clusterMembers, key=lambda x: x.getPriority(self.order.items), reverse=True)
+            cluster = clusters[rng.randrange(numUsedClusters)]
+            if rng.random() < 0.1:
+                members = context.getRankedClusterMembers(cluster).copy()
             else:
-                random.shuffle(cluster.clusterMembers)
-        return clusters
+                members = context.getClusterMembers(cluster).copy()
+                rng.shuffle(members)
+        return clusters, None, (cluster, members)
 
-    def localSearch(self):
+    def localSearch(self, context:ScheduleContext):
         """
         Brief:
-            Local search for the given route.
+            Local search for the given route. The search is anytime: it stops at maxIteration,
+            at the deadline of the context or after maxStallIteration iterations without
+            improvement, whichever comes first, and context.best_route is always the best so far.
+
+            The route of a ranking only depends on its positions up to the one that satisfies
+            the order, so the rankings are remembered by their prefix up to the longest such
+            position seen (the horizon). A drawn ranking whose prefix was already evaluated, or
+            a swap of two clusters swapped in the last tabuTenure iterations, is skipped.
+
+            With batchSize > 1 each step draws batchSize moves and scores all of their
+            rankings at once, and only the best one is kept if it improves. Every move
+            counts as one iteration.
         Args:
-
-        Return:
-
+            context: the scheduling state of the request, context.best_route is updated in place
         """
-        for _ in range(self.maxIteration):
-            clusters = self.getLocalCluster()
-            rankedSuppliers = []
-            for cluster in clusters:
-                rankedSuppliers.extend(cluster.clusterMembers)
-            # initialize the route
-            route = Route(self.order)
-            route.setRider(rankedSuppliers[0].getNearestRider())
-            # initialize the route with greedy insertion
-            for supplier in rankedSuppliers:
-                route.addSupplier(supplier)
-            route.setCost(self.EvaluateRoute(route))
-            if route.cost < self.best_route.cost:
-                print("- New best route found") # debug
-                print(route) # debug
-                self.best_route = route
-                self.clusters = clusters
-
+        if context.routeBuilder is None:
+            context.routeBuilder = RouteBuilder(context)
+        builder = context.routeBuilder
+        memo = OrderedDict() # ranking prefix -> cost, in least recently used order
+        tabu = deque(maxlen=self.tabuTenure) # the recently swapped cluster pairs
+        context.searchHorizon = builder.numProcessed
+        if self.memoSize > 0 and builder.numProcessed > 0:
+            memo[builder.ranking[:builder.numProcessed].tobytes()] = builder.cost
+        step = self.searchStep if self.batchSize == 1 else self.searchBatchStep
+        if self.batchSize > 1:
+            rng = context.random if context.random is not None else random
+            context.batchRandom = np.random.default_rng(rng.getrandbits(64))
+        numMemoHit, numTabuHit = context.numMemoHit, context.numTabuHit
+        initialCost = context.best_route.cost
+        start = time.perf_counter()
+        context.costTrace = [(0.0, 0, initialCost)]
+        iteration = 0
+        stall = 0
+        while self.maxIteration is None or iteration < self.maxIteration:
+            if context.deadline is not None and time.monotonic() >= context.deadline:
+                break
+            if self.maxStallIteration is not None and stall >= self.maxStallIteration:
+                break
+            size = self.batchSize if self.maxIteration is None else min(self.batchSize, self.maxIteration - iteration)
+            iteration += size
+            stall += size
+            if step(context, size, memo, tabu):
+                context.costTrace.append((time.perf_counter() - start, iteration, context.best_route.cost))
+                stall = 0
+        context.numIteration += iteration
+
+        metrics.increment("iterations", iteration)
+        metrics.increment("improvements", len(context.costTrace) - 1)
+        metrics.increment("memo_hits", context.numMemoHit - numMemoHit)
+        metrics.increment("tabu_hits", context.numTabuHit - numTabuHit)
+        metrics.observe("search_iterations", iteration, COUNT_BUCKETS)
+        if np.isfinite(initialCost) and initialCost > 0:
+            metrics.observe("search_cost_ratio", context.best_route.cost / initialCost, RATIO_BUCKETS)
+        logger.debug("Local search: %d iterations, best cost progress %s", iteration, context.costTrace)
+
+    def remember(self, memo:OrderedDict, key:bytes, cost:float):
+        """
+        Brief:
+            add an evaluated ranking prefix to the memo, dropping the least recently used one when full
+        """
+        memo[key] = cost
+        if len(memo) > self.memoSize:
+            memo.popitem(last=False)
 
-    def getDistance(self, id1:int, id2:int):
+    def searchStep(self, context:ScheduleContext, size:int, memo:OrderedDict, tabu:deque) -> bool:
         """
         Brief:
-            return distance between two units
-        Args:
-            id1: id of first unit
-            id2: id of second unit
+            draw one move, up to maxRedraw more if it is a repeat, and replay it with the
+            incremental route builder. The member reorderings stay in the context.
         Returns:
-            distance between two units
-        """
-        if id1 > id2:
-            id1, id2 = id2, id1
-        n = len(self.suppliers)
-        m = len(self.suppliers) + self.numRider
-        assert id1 >= 0 and id2 >= 0, "id1 and id2 must be non-negative"
-        assert id1 <= len(self.suppliers), "Invalid order or supplier id"
-        assert id2 <= len(self.suppliers) + self.numRider, "Invalid order or supplier id or rider id"
-        assert id2 <= len(self.suppliers) if id1 == 0 else True, "Distances involving order address should only be compared with suppliers"
-        if id1 == id2:
-            return 0
-        if id1 == 0:
-            return self.distances[id2 - 1]
-        else:
-            index = n
-            num_series = id1 - 1
-            index += num_series * (m - 1) - num_series * (num_series - 1) // 2
-            index += id2 - id1 - 1
-            return self.distances[index]
-
-    def EvaluateRoute(self, route:Route):
-        """
-        Evaluate the given route.
-        """
-        total_cost = 0
-        if len(route.suppliers) != 0:
-            total_cost += self.getDistance(route.rider.id, route.suppliers[0].id)
-            for i in range(len(route.suppliers)-1):
-                total_cost += self.getDistance(route.suppliers[i].id, route.suppliers[i+1].id)
-            total_cost += self.getDistance(route.suppliers[-1].id, route.order.id)
+            improved (bool) : whether the best route improved
+        """
+        builder = context.routeBuilder
+        horizon = context.searchHorizon
+        for _ in range(self.maxRedraw + 1):
+            clusters, move, members = self.getLocalCluster(context)
+            if move in tabu:
+                context.numTabuHit += 1
+                continue
+            if members is not None:
+                context.getClusterMembers(members[0])[:] = members[1]
+            rankedSuppliers = context.getRankedSuppliers(clusters)
+            if self.memoSize > 0 and rankedSuppliers[:horizon].tobytes() in memo:
+                memo.move_to_end(rankedSuppliers[:horizon].tobytes())
+                context.numMemoHit += 1
+                continue
+            break
         else:
-            total_cost = float('inf')
-        return total_cost
-
-    def clusterSuppliers(self):
+            return False # every move drawn was a repeat
+        # replay the greedy insertion from the first changed position only
+        cost = builder.build(rankedSuppliers)
+        context.searchHorizon = max(context.searchHorizon, builder.numProcessed)
+        if self.memoSize > 0:
+            self.remember(memo, rankedSuppliers[:context.searchHorizon].tobytes(), cost)
+        if move is not None:
+            tabu.append(move)
+        if cost < context.best_route.cost:
+            route = builder.toRoute()
+            logger.debug("New best route found: %s", route)
+            context.best_route = route
+            context.clusterOrder = clusters
+            return True
+        return False
+
+    def searchBatchStep(self, context:ScheduleContext, size:int, memo:OrderedDict, tabu:deque) -> bool:
         """
-        Cluster suppliers into clusters.
+        Brief:
+            draw size moves at once and score their rankings together, without touching the
+            context. The best move is applied and replayed with the route builder if it
+            improves the best route.
+        Returns:
+            improved (bool) : whether the best route improved
         """
-        # cluster suppliers
-        clusterIds = list(self.suppliers.keys())
-        clusterIds = sorted(clusterIds, key=lambda x: len(self.suppliers[x].aroundSuppliers), reverse=True)
-        while len(clusterIds) > 0:
-            clusterCenter = self.suppliers[clusterIds[0]]
-            clusterIds.remove(clusterIds[0])
-            clusterCenter.setCenter()
-            self.clusters.append(clusterCenter)
-            for supplier in clusterCenter.aroundSuppliers:
-                supplier.updateClusterIfCloser(clusterCenter, self.getDistance(supplier.id, clusterCenter.id))
-                if supplier.id in clusterIds:
-                    clusterIds.remove(supplier.id)
-
-
+        builder = context.routeBuilder
+        numUsedClusters = len(context.best_route.numSupplierEachCluster)
+        batch = MoveBatch(context, context.batchRandom, size, numUsedClusters)
+        moves = [batch.getMove(index) for index in range(size)]
+        rows = np.array([index for index, move in enumerate(moves) if move not in tabu], dtype=np.int64)
+        context.numTabuHit += size - len(rows)
+        numPosition = len(batch.base)
+        horizon = context.searchHorizon
+        length = min(numPosition, max(builder.chunkSize, horizon))
+        rankings = batch.getRankings(rows, length)
+        if self.memoSize > 0:
+            keep = np.zeros(len(rows), dtype=bool)
+            drawn = set()
+            for index, ranking in enumerate(rankings):
+                key = ranking[:horizon].tobytes()
+                if key in memo:
+                    memo.move_to_end(key)
+                elif key not in drawn:
+                    drawn.add(key)
+                    keep[index] = True
+            context.numMemoHit += len(rows) - int(keep.sum())
+            rows, rankings = rows[keep], rankings[keep]
+        if len(rows) == 0:
+            return False
+        for index in rows.tolist():
+            if moves[index] is not None:
+                tabu.append(moves[index])
+
+        # extend the prefixes until every ranking satisfies the order or is complete
+        while True:
+            costs, ends, satisfied = builder.evaluate(rankings)
+            if satisfied.all() or length == numPosition:
+                break
+            length = min(numPosition, 2 * length)
+            rankings = batch.getRankings(rows, length)
+        context.searchHorizon = max(horizon, int(ends.max()))
+        if self.memoSize > 0:
+            for ranking, cost in zip(rankings, costs.tolist()):
+                self.remember(memo, ranking[:context.searchHorizon].tobytes(), cost)
+
+        best = int(np.argmin(costs))
+        if costs[best] >= context.best_route.cost:
+            return False
+        clusters = batch.apply(int(rows[best]))
+        builder.build(context.getRankedSuppliers(clusters))
+        route = builder.toRoute()
+        logger.debug("New best route found: %s", route)
+        context.best_route = route
+        context.clusterOrder = clusters
+        return True
+
+    def setPriorities(self, context:ScheduleContext, alpha:float = 0.1):
+        """
+        Brief:
+            compute the priority of every supplier and cluster for the order of the context once,
+            and the priority order of the members of each cluster
+        Args:
+            context: the scheduling state of the request
+            alpha: the bigger alpha, the more prosperous supplier and cluster will be preferred
+        """
+        context.supplierPriority[context.supplierIds] = self.getPriority(context, context.supplierIds, context.supply, alpha)
+        context.clusterPriority = self.getPriority(context, context.clusterCenters, context.clusterSupply, alpha)
+        segment = np.repeat(np.arange(len(context.clusterCenters)), np.diff(context.memberIndptr))
+        context.rankedMemberIds = context.memberIds[np.lexsort((-context.supplierPriority[context.memberIds], segment))]
 
+    def getPriority(self, context:ScheduleContext, supplierIds:np.ndarray, supply:np.ndarray, alpha:float = 0.1) -> np.ndarray:
+        """
+        get the priority of the suppliers
+        Args:
+            context: the scheduling state of the request
+            supplierIds: the suppliers to rank, or the centers of the clusters to rank
+            supply: the stock to rank, the supply matrix for suppliers or the cluster supply matrix for clusters
+            alpha: the bigger alpha, the more prosperous supplier will be preferred
+        """
+        numAround = np.diff(context.aroundRiderIndptr)[supplierIds] + np.diff(context.aroundIndptr)[supplierIds]
+        amounts = supply[supplierIds][:, context.order.itemIds]
+        priority = 0 - context.distanceToOrder[supplierIds] # tend to choose the supplier with the shortest distance to order
+        priority -= context.nearestRiderDistance[supplierIds] # tend to choose the supplier with the shortest distance to nearest rider
+        priority *= (1 + alpha*np.exp(-numAround)) # tend to choose the supplier with more around suppliers and riders
+        priority *= np.where(amounts > 0, 1 + alpha*np.exp(-amounts), 0).sum(axis=1) # tend to choose the supplier with more items
+        return priority
+
+    def clusterSuppliers(self, context:ScheduleContext, previous:ScheduleContext = None):
+        """
+        Cluster suppliers into clusters.
 
+        The suppliers with the most around suppliers become centers first, and a supplier
+        becomes a center only if no earlier center has it around. Every other supplier then
+        joins the closest center it is around, the earliest center wins on ties.
 
+        With the context of the previous request, the previous clusters are kept where the
+        neighborhoods didn't change: a center with the same around suppliers stays a center,
+        before the new ones, and a supplier with the same around suppliers stays in its
+        cluster if its center does. Only the other suppliers are clustered as above.
+        """
+        supplierIds = context.supplierIds
+        covered = np.zeros(context.numSupplier + 1, dtype=bool)
+        joinTime = np.full(context.numSupplier + 1, -1, dtype=np.int64)
+        keptCenters = np.zeros(0, dtype=np.int64)
+        keptMembers = np.zeros(0, dtype=np.int64)
+        if previous is not None:
+            unchanged = self.getUnchangedSuppliers(context, previous)
+            keptCenters = previous.clusterCenters[unchanged[previous.clusterCenters]]
+            isKeptCenter = np.zeros(context.numSupplier + 1, dtype=bool)
+            isKeptCenter[keptCenters] = True
+            keptMembers = supplierIds[unchanged[supplierIds] & isKeptCenter[previous.clusterOf[supplierIds]]]
+            # the kept members join their cluster in their previous order, before the new members
+            position = np.zeros(context.numSupplier + 1, dtype=np.int64)
+            position[previous.memberIds] = np.arange(len(previous.memberIds))
+            joinTime[keptMembers] = position[keptMembers]
+            joinTime[keptCenters] = -1
+            covered[keptMembers] = True
+            for centerId in keptCenters.tolist():
+                covered[context.getAroundSuppliers(centerId)] = True
+
+        # pick the new centers, marking the around suppliers of each center as covered
+        numAround = np.diff(context.aroundIndptr)[supplierIds]
+        candidates = supplierIds[np.argsort(-numAround, kind="stable")]
+        centers = keptCenters.tolist()
+        for centerId in candidates.tolist():
+            if covered[centerId]:
+                continue
+            covered[centerId] = True
+            covered[context.getAroundSuppliers(centerId)] = True
+            centers.append(centerId)
+        centers = np.array(centers, dtype=np.int64)
+
+        # every (center, around supplier) pair, in center creation order
+        starts = context.aroundIndptr[centers]
+        sizes = context.aroundIndptr[centers + 1] - starts
+        pairSupplier = context.aroundIds[sliceIndices(starts, sizes)]
+        pairCenter = np.repeat(centers, sizes)
+        pairRank = np.repeat(np.arange(len(centers)), sizes)
+        pairPosition = np.arange(len(pairSupplier)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        pairDistance = context.distanceMatrix[pairSupplier, pairCenter]
+        isAssigned = np.zeros(context.numSupplier + 1, dtype=bool)
+        isAssigned[centers] = True
+        isAssigned[keptMembers] = True
+        keep = ~isAssigned[pairSupplier]
+        pairSupplier, pairCenter, pairRank, pairPosition, pairDistance = pairSupplier[keep], pairCenter[keep], pairRank[keep], pairPosition[keep], pairDistance[keep]
+
+        # the closest center of each member, the earliest one wins on ties
+        closest = np.lexsort((pairRank, pairDistance, pairSupplier))
+        first = np.ones(len(closest), dtype=bool)
+        first[1:] = pairSupplier[closest][1:] != pairSupplier[closest][:-1]
+        closest = closest[first]
+
+        context.clusterOf[:] = -1
+        context.distanceToClusterCenter[:] = np.inf
+        if previous is not None:
+            context.clusterOf[keptMembers] = previous.clusterOf[keptMembers]
+            context.distanceToClusterCenter[keptMembers] = previous.distanceToClusterCenter[keptMembers]
+        context.clusterOf[centers] = centers
+        context.distanceToClusterCenter[centers] = 0
+        context.clusterOf[pairSupplier[closest]] = pairCenter[closest]
+        context.distanceToClusterCenter[pairSupplier[closest]] = pairDistance[closest]
+        # the members join their cluster in the order of the around suppliers of the center
+        joinTime[pairSupplier[closest]] = pairPosition[closest] + (len(previous.memberIds) if previous is not None else 0)
+        self.setClusters(context, centers, joinTime)
+
+    def getUnchangedSuppliers(self, context:ScheduleContext, previous:ScheduleContext) -> np.ndarray:
+        """
+        Brief:
+            find the candidate suppliers that were candidates of the previous request with the same around suppliers
+        Returns:
+            unchanged (np.ndarray) : supplier id -> whether it is unchanged
+        """
+        unchanged = np.zeros(context.numSupplier + 1, dtype=bool)
+        unchanged[previous.supplierIds] = True
+        supplierIds = context.supplierIds[unchanged[context.supplierIds]]
+        unchanged[:] = False
+        starts, previousStarts = context.aroundIndptr[supplierIds], previous.aroundIndptr[supplierIds]
+        sizes = context.aroundIndptr[supplierIds + 1] - starts
+        sameSize = sizes == previous.aroundIndptr[supplierIds + 1] - previousStarts
+        supplierIds, starts, previousStarts, sizes = supplierIds[sameSize], starts[sameSize], previousStarts[sameSize], sizes[sameSize]
+        # count the around suppliers that differ, the lists are in id order
+        differ = context.aroundIds[sliceIndices(starts, sizes)] != previous.aroundIds[sliceIndices(previousStarts, sizes)]
+        numDiffer = np.bincount(np.repeat(np.arange(len(supplierIds)), sizes), weights=differ, minlength=len(supplierIds))
+        unchanged[supplierIds[numDiffer == 0]] = True
+        return unchanged
+
+    def setClusters(self, context:ScheduleContext, centers:np.ndarray, joinTime:np.ndarray):
+        """
+        Brief:
+            build the cluster membership arrays once every supplier has its cluster center
+        Args:
+            context: the scheduling state of the request
+            centers: the cluster centers in creation order
+            joinTime: the order in which each supplier joined its cluster, compared within a cluster
+        """
+        supplierIds = context.supplierIds
+        context.clusterCenters = centers
+        context.clusterIndex[:] = -1
+        context.clusterIndex[centers] = np.arange(len(centers))
+        clusterOfMember = context.clusterIndex[context.clusterOf[supplierIds]]
+        context.memberIds = supplierIds[np.lexsort((joinTime[supplierIds], clusterOfMember))]
+        context.memberIndptr = np.concatenate([[0], np.cumsum(np.bincount(clusterOfMember, minlength=len(centers)))])
+        context.clusterOrder = np.arange(len(centers))
+
+        # aggregate the stock of each cluster in one pass
+        context.clusterSupply = np.zeros_like(context.supply)
+        np.add.at(context.clusterSupply, context.clusterOf[supplierIds], context.supply[supplierIds])
@@ -0,0 +1,91 @@
+import numpy as np
+
+def bestTwoOptMove(distances:np.ndarray, path:np.ndarray):
+    """
+    Brief:
+        find the best 2-opt move of an open path with fixed endpoints. Reversing
+        path[i..j] replaces the edges (i-1, i) and (j, j+1) with (i-1, j) and (i, j+1),
+        so the delta of every move is four lookups in the distance matrix.
+    Args:
+        distances: the distances between the local indices of the path, symmetric
+            between the inner stops
+        path: the local indices of the stops, path[0] and path[-1] never move
+    Returns:
+        (delta, i, j) : the best cost change and the reversed positions, delta is 0
+            when no move improves
+    """
+    inner = np.arange(1, len(path) - 1)
+    if len(inner) < 2:
+        return 0.0, 0, 0
+    first, last = inner[:, None], inner[None, :]
+    delta = distances[path[first - 1], path[last]] + distances[path[first], path[last + 1]] \
+        - distances[path[first - 1], path[first]] - distances[path[last], path[last + 1]]
+    delta = np.where(last > first, delta, np.inf)
+    best = np.unravel_index(np.argmin(delta), delta.shape)
+    if delta[best] >= 0:
+        return 0.0, 0, 0
+    return float(delta[best]), int(inner[best[0]]), int(inner[best[1]])
+
+def bestOrOptMove(distances:np.ndarray, path:np.ndarray, maxSegment:int = 3):
+    """
+    Brief:
+        find the best Or-opt move of an open path with fixed endpoints. Moving
+        path[i..i+L-1] between path[j] and path[j+1] replaces the edges (i-1, i),
+        (i+L-1, i+L) and (j, j+1) with (i-1, i+L), (j, i) and (i+L-1, j+1).
+    Args:
+        distances: the distances between the local indices of the path
+        path: the local indices of the stops, path[0] and path[-1] never move
+        maxSegment: the longest segment moved
+    Returns:
+        (delta, i, length, j) : the best cost change, the moved segment and the edge it is
+            inserted into, delta is 0 when no move improves
+    """
+    best = (0.0, 0, 0, 0)
+    numStop = len(path)
+    for length in range(1, min(maxSegment, numStop - 3) + 1):
+        start = np.arange(1, numStop - length)[:, None] # first position of the segment
+        end = start + length - 1 # last position of the segment
+        edge = np.arange(numStop - 1)[None, :] # the segment goes between edge and edge + 1
+        delta = distances[path[start - 1], path[end + 1]] + distances[path[edge], path[start]] + distances[path[end], path[edge + 1]] \
+            - distances[path[start - 1], path[start]] - distances[path[end], path[end + 1]] - distances[path[edge], path[edge + 1]]
+        delta = np.where((edge < start - 1) | (edge > end), delta, np.inf)
+        index = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[index] < best[0]:
+            best = (float(delta[index]), int(start[index[0], 0]), length, int(edge[0, index[1]]))
+    return best
+
+def moveSegment(path:np.ndarray, start:int, length:int, edge:int) -> np.ndarray:
+    """
+    Brief:
+        return the path with path[start..start+length-1] moved between path[edge] and path[edge+1]
+    """
+    segment = path[start:start + length]
+    rest = np.concatenate([path[:start], path[start + length:]])
+    position = edge + 1 if edge < start else edge + 1 - length
+    return np.concatenate([rest[:position], segment, rest[position:]])
+
+def sequencePath(distances:np.ndarray, path:np.ndarray, maxPass:int = 1000, epsilon:float = 1e-9) -> np.ndarray:
+    """
+    Brief:
+        apply the best 2-opt or Or-opt move until no move improves the path
+    Args:
+        distances: the distances between the local indices of the path
+        path: the local indices of the stops, path[0] and path[-1] never move
+        maxPass: the maximum number of applied moves
+        epsilon: the smallest improvement applied, so float noise can't make it cycle
+    Returns:
+        path (np.ndarray) : the improved path
+    """
+    path = path.copy()
+    for _ in range(maxPass):
+        twoOpt = bestTwoOptMove(distances, path)
+        orOpt = bestOrOptMove(distances, path)
+        if min(twoOpt[0], orOpt[0]) > -epsilon:
+            break
+        if twoOpt[0] <= orOpt[0]:
+            _, first, last = twoOpt
+            path[first:last + 1] = path[first:last + 1][::-1]
+        else:
+            _, start, length, edge = orOpt
+            path = moveSegment(path, start, length, edge)
+    return path
@@ -0,0 +1,76 @@
+"""
+Benchmark RouteScheduler.clusterSuppliers against the list based leader clustering it
+replaced, over the number of suppliers and the aroundScope density.
+
+    python3 benchmark/cluster_benchmark.py --sizes 500 1000 2000 --scopes 50 100 200
+"""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ESS_Protobuf")))
+
+import argparse
+import time
+import DVPR
+from instances import makeRequest
+
+def leaderClustering(context):
+    """
+    Brief:
+        the clustering before the rewrite, with list membership and per supplier updates
+    Returns:
+        clusterOf (dict) : supplier id -> center id
+    """
+    clusterOf, distanceToCenter = {}, {}
+    clusterIds = sorted(context.supplierIds.tolist(), key=lambda x: len(context.getAroundSuppliers(x)), reverse=True)
+    while len(clusterIds) > 0:
+        centerId = clusterIds[0]
+        clusterIds.remove(centerId)
+        clusterOf[centerId] = centerId
+        distanceToCenter[centerId] = 0
+        for supplierId in context.getAroundSuppliers(centerId).tolist():
+            distance = context.distanceMatrix[supplierId, centerId]
+            if distanceToCenter.get(supplierId, float("inf")) > distance:
+                clusterOf[supplierId] = centerId
+                distanceToCenter[supplierId] = distance
+            if supplierId in clusterIds:
+                clusterIds.remove(supplierId)
+    return clusterOf
+
+def bestOf(function, repeat:int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 500, 1000, 2000])
+    parser.add_argument("--scopes", type=float, nargs="+", default=[50.0, 100.0, 200.0])
+    parser.add_argument("--riders", type=int, default=50)
+    parser.add_argument("--side", type=float, default=2000.0, help="side of the square the units are spread over")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-reference", action="store_true", help="skip the leader clustering reference")
+    args = parser.parse_args()
+
+    print("{:>8} {:>8} {:>10} {:>9} {:>12} {:>14} {:>9}".format("n", "scope", "avg around", "clusters", "cluster ms", "reference ms", "speedup"))
+    for numSupplier in args.sizes:
+        request = makeRequest(numSupplier, args.riders, side=args.side, numHotspot=0, seed=args.seed)
+        for scope in args.scopes:
+            # cluster every supplier, not only the candidates of the order
+            scheduler = DVPR.RouteScheduler(aroundScope=scope, pruneSuppliers=False)
+            context = scheduler.initializeFromRequest(request)
+            elapsed = bestOf(lambda: scheduler.clusterSuppliers(context), args.repeat)
+            avgAround = len(context.aroundIds) / max(numSupplier, 1)
+            if args.no_reference:
+                print("{:>8} {:>8.0f} {:>10.1f} {:>9} {:>12.2f} {:>14} {:>9}".format(numSupplier, scope, avgAround, len(context.clusterCenters), elapsed * 1e3, "-", "-"))
+                continue
+            reference = bestOf(lambda: leaderClustering(context), args.repeat)
+            clusterOf = leaderClustering(context)
+            assert all(context.clusterOf[supplierId] == centerId for supplierId, centerId in clusterOf.items()), "cluster assignments differ"
+            print("{:>8} {:>8.0f} {:>10.1f} {:>9} {:>12.2f} {:>14.2f} {:>8.1f}x".format(numSupplier, scope, avgAround, len(context.clusterCenters), elapsed * 1e3, reference * 1e3, reference / elapsed))
+
+if __name__ == "__main__":
+    main()
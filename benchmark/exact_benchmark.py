@@ -0,0 +1,55 @@
+"""
+Measure the heuristic search against the exact solver on small instances, where the
+exact route is the optimum: the gap of the heuristic cost and the latency of both.
+
+    python3 benchmark/exact_benchmark.py --sizes 6 9 12 --instances 20
+"""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ESS_Protobuf")))
+
+import argparse
+import time
+
+import numpy as np
+import DVPR
+from instances import makeRequest
+
+def solve(scheduler, request):
+    context = scheduler.initializeFromRequest(request)
+    start = time.perf_counter()
+    route = scheduler.searchRoute(context)
+    return (route.cost if route is not None else float("inf")), time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[6, 9, 12])
+    parser.add_argument("--instances", type=int, default=20, help="instances of each size")
+    parser.add_argument("--riders", type=int, default=5)
+    parser.add_argument("--side", type=float, default=2000.0, help="side of the square the units are spread over")
+    parser.add_argument("--items", type=int, default=3, help="number of item types of the order")
+    parser.add_argument("--demand", type=float, default=8.0, help="mean amount of each item of the order")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    heuristic = DVPR.RouteScheduler(exactThreshold=None, seed=args.seed)
+    exact = DVPR.RouteScheduler(exactThreshold=max(args.sizes))
+    print("{:>6} {:>9} {:>10} {:>10} {:>9} {:>14} {:>10}".format("n", "feasible", "mean gap", "max gap", "optimal", "heuristic ms", "exact ms"))
+    for numSupplier in args.sizes:
+        gaps, heuristicTimes, exactTimes = [], [], []
+        for instance in range(args.instances):
+            request = makeRequest(numSupplier, args.riders, numOrderItem=args.items, demand=args.demand, side=args.side, seed=args.seed + instance)
+            heuristicCost, heuristicTime = solve(heuristic, request)
+            exactCost, exactTime = solve(exact, request)
+            heuristicTimes.append(heuristicTime)
+            exactTimes.append(exactTime)
+            if np.isfinite(exactCost):
+                gaps.append(heuristicCost / exactCost - 1)
+        gaps = np.array(gaps)
+        assert np.all(gaps > -1e-9), "the heuristic beat the exact solver"
+        print("{:>6} {:>9} {:>9.2f}% {:>9.2f}% {:>9} {:>14.2f} {:>10.2f}".format(
+            numSupplier, len(gaps), 100 * gaps.mean() if len(gaps) else 0, 100 * gaps.max() if len(gaps) else 0,
+            int(np.sum(gaps < 1e-9)), 1e3 * np.mean(heuristicTimes), 1e3 * np.mean(exactTimes)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Synthetic ScheduleRequest instances for the benchmarks.
+
+The order, the suppliers and the riders are points of a side x side city. The suppliers
+gather around a few shopping hotspots, the riders wander around the whole city, and the
+distances are euclidean or manhattan, so the distance vector is metric. The item types
+follow a Zipf popularity: a few staples are stocked by most suppliers, the rest by few.
+"""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ESS_Protobuf")))
+
+import numpy as np
+from interface_pb2 import ItemList, ScheduleRequest
+
+def makePoints(rng:np.random.Generator, numSupplier:int, numRider:int, side:float, numHotspot:int) -> np.ndarray:
+    """
+    Brief:
+        the positions of the order, the suppliers and the riders, in unit id order
+    """
+    order = rng.uniform(0, side, size=(1, 2))
+    if numHotspot > 0:
+        hotspots = rng.uniform(0, side, size=(numHotspot, 2))
+        suppliers = hotspots[rng.integers(numHotspot, size=numSupplier)] + rng.normal(0, side / 20, size=(numSupplier, 2))
+    else:
+        suppliers = rng.uniform(0, side, size=(numSupplier, 2))
+    riders = rng.uniform(0, side, size=(numRider, 2))
+    return np.clip(np.concatenate([order, suppliers, riders]), 0, side)
+
+def condensedDistances(points:np.ndarray, numSupplier:int, metric:str = "euclidean") -> np.ndarray:
+    """
+    Brief:
+        the distance vector in the request layout: the order to each supplier, then the upper
+        triangle over the suppliers and riders row by row
+    """
+    units = points[1:]
+    if metric == "euclidean":
+        distances = lambda a, b: np.sqrt(((a[:, None] - b[None]) ** 2).sum(-1))
+    elif metric == "manhattan":
+        distances = lambda a, b: np.abs(a[:, None] - b[None]).sum(-1)
+    else:
+        raise ValueError("Unknown metric {}".format(metric))
+    rows, cols = np.triu_indices(len(units), k=1)
+    return np.concatenate([distances(points[:1], units[:numSupplier])[0], distances(units, units)[rows, cols]])
+
+def makeOrder(rng:np.random.Generator, popularity:np.ndarray, numOrderItem:int, demand:float) -> dict:
+    """
+    Brief:
+        the items of an order, among the most popular, and their amounts
+    """
+    orderItems = rng.choice(len(popularity), size=min(numOrderItem, len(popularity)), replace=False, p=popularity)
+    return {"item{}".format(item): float(max(1, rng.poisson(demand))) for item in orderItems.tolist()}
+
+def makeStock(rng:np.random.Generator, popularity:np.ndarray, numSupplier:int, maxStock:int) -> list:
+    """
+    Brief:
+        the item lists of some suppliers, each one stocks a few items of the popular ones
+    """
+    numStocked = rng.integers(1, min(4, len(popularity)) + 1, size=numSupplier)
+    stock = []
+    for size in numStocked.tolist():
+        items = rng.choice(len(popularity), size=size, replace=False, p=popularity)
+        amounts = rng.integers(1, maxStock + 1, size=size)
+        stock.append({"item{}".format(item): float(amount) for item, amount in zip(items.tolist(), amounts.tolist())})
+    return stock
+
+def toRequest(points:np.ndarray, order:dict, stock:list, metric:str = "euclidean") -> ScheduleRequest:
+    """
+    Brief:
+        build the request of an order over the suppliers and riders at the given points
+    """
+    numSupplier = len(stock)
+    request = ScheduleRequest()
+    for item, amount in order.items():
+        request.request.items[item] = amount
+    for items in stock:
+        request.itemlists.append(ItemList(items=items))
+    request.num_deliverer = len(points) - 1 - numSupplier
+    request.distance.extend(condensedDistances(points, numSupplier, metric).tolist())
+    return request
+
+def makeRequest(numSupplier:int, numRider:int, numItem:int = 10, numOrderItem:int = 3, demand:float = 10.0,
+                maxStock:int = 10, side:float = 2000.0, numHotspot:int = 5, metric:str = "euclidean", seed:int = 0) -> ScheduleRequest:
+    """
+    Brief:
+        generate a ScheduleRequest
+    Args:
+        numSupplier: the number of suppliers
+        numRider: the number of free riders
+        numItem: the number of item types
+        numOrderItem: the number of item types the order asks for, among the most popular
+        demand: the mean amount of each item the order asks for
+        maxStock: the largest amount of an item a supplier stocks
+        side: the side of the city
+        numHotspot: the number of places the suppliers gather around, 0 to spread them uniformly
+        metric: "euclidean" or "manhattan"
+        seed: the seed of the instance
+    Returns:
+        request (ScheduleRequest) : the generated request
+    """
+    rng = np.random.default_rng(seed)
+    points = makePoints(rng, numSupplier, numRider, side, numHotspot)
+    popularity = 1.0 / np.arange(1, numItem + 1)
+    popularity /= popularity.sum()
+    order = makeOrder(rng, popularity, numOrderItem, demand)
+    stock = makeStock(rng, popularity, numSupplier, maxStock)
+    return toRequest(points, order, stock, metric)
+
+def makeSnapshots(numSupplier:int, numRider:int, numSnapshot:int, numStockChange:int = 5, numRiderMove:int = 2,
+                  orderShift:float = 100.0, numItem:int = 10, numOrderItem:int = 3, demand:float = 10.0, maxStock:int = 10,
+                  side:float = 2000.0, numHotspot:int = 5, metric:str = "euclidean", seed:int = 0) -> list:
+    """
+    Brief:
+        generate the requests of consecutive snapshots of the same suppliers and riders, each
+        one a little changed from the last: a few suppliers restock or sell out, a few riders
+        move, and the order of the same items moves a little and asks for new amounts
+    Args:
+        numSnapshot: the number of requests
+        numStockChange: the number of suppliers whose stock changes between snapshots
+        numRiderMove: the number of riders that move between snapshots
+        orderShift: the standard deviation of the move of the order between snapshots
+        the other arguments are the ones of makeRequest
+    Returns:
+        requests (list) : the ScheduleRequest of each snapshot
+    """
+    rng = np.random.default_rng(seed)
+    points = makePoints(rng, numSupplier, numRider, side, numHotspot)
+    popularity = 1.0 / np.arange(1, numItem + 1)
+    popularity /= popularity.sum()
+    order = makeOrder(rng, popularity, numOrderItem, demand)
+    stock = makeStock(rng, popularity, numSupplier, maxStock)
+    requests = [toRequest(points, order, stock, metric)]
+    for _ in range(numSnapshot - 1):
+        changed = rng.choice(numSupplier, size=min(numStockChange, numSupplier), replace=False)
+        for supplier, items in zip(changed.tolist(), makeStock(rng, popularity, len(changed), maxStock)):
+            stock[supplier] = items
+        movers = 1 + numSupplier + rng.choice(numRider, size=min(numRiderMove, numRider), replace=False)
+        points[movers] = rng.uniform(0, side, size=(len(movers), 2))
+        points[0] = np.clip(points[0] + rng.normal(0, orderShift, size=2), 0, side)
+        order = {item: float(max(1, rng.poisson(demand))) for item in order}
+        requests.append(toRequest(points, order, stock, metric))
+    return requests
@@ -0,0 +1,227 @@
+"""
+Load test the Algorithm service: send Schedule RPCs built from synthetic instances, either
+from a fixed number of concurrent clients (closed loop) or at a fixed request rate (open
+loop), and report the latency percentiles, the throughput and the failed RPCs, the ones rejected
+by the admission limit of the server apart.
+
+Unless --target is given, the server is started locally from main.py, and --env passes it
+settings, e.g. the worker counts to tune:
+
+    python3 benchmark/loadtest.py --concurrency 1 4 16 --env ESS_GRPC_WORKERS=4
+    python3 benchmark/loadtest.py --rate 5 20 --deadline 1.0 --env ESS_PROCESS_WORKERS=4
+    python3 benchmark/loadtest.py --target localhost:50051 --concurrency 8
+
+In the open loop the latency of a RPC is measured from the time it was due to be sent, so a
+saturated client does not hide the queueing delay.
+"""
+import os, sys
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "ESS_Protobuf"))
+
+import argparse
+import json
+import signal
+import subprocess
+import threading
+import time
+from collections import Counter
+
+import grpc
+import numpy as np
+from interface_pb2 import PingRequest
+import interface_pb2_grpc
+from instances import makeRequest
+
+class Recorder:
+    """
+    The outcomes of the RPCs sent in the measured window, shared by the client threads.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.codes = Counter()
+        self.numEmpty = 0
+
+    def record(self, latency:float, code:grpc.StatusCode, reply = None):
+        with self.lock:
+            self.codes[code.name] += 1
+            if code == grpc.StatusCode.OK:
+                self.latencies.append(latency)
+                self.numEmpty += len(reply.route) == 0
+
+    def report(self, window:float) -> dict:
+        """
+        Brief:
+            summarize the outcomes
+        Args:
+            window: the seconds of the measured window
+        Returns:
+            summary (dict) : the counts, the throughput of the successful RPCs and their latency percentiles in ms
+        """
+        with self.lock:
+            latencies = np.array(self.latencies) * 1e3
+            summary = {
+                "sent": sum(self.codes.values()),
+                "ok": self.codes.get("OK", 0),
+                "empty": self.numEmpty,
+                "deadline_exceeded": self.codes.get("DEADLINE_EXCEEDED", 0),
+                "rejected": self.codes.get("RESOURCE_EXHAUSTED", 0),
+                "errors": sum(count for code, count in self.codes.items() if code not in ("OK", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED")),
+                "codes": dict(self.codes),
+                "throughput": len(latencies) / window,
+            }
+        for name, q in (("p50", 50), ("p95", 95), ("p99", 99)):
+            summary[name] = float(np.percentile(latencies, q)) if len(latencies) > 0 else float("nan")
+        summary["max"] = float(latencies.max()) if len(latencies) > 0 else float("nan")
+        return summary
+
+def sendBlocking(stub, request, deadline:float, recorder:Recorder, start:float, measured:bool):
+    try:
+        reply = stub.Schedule(request, timeout=deadline)
+        code = grpc.StatusCode.OK
+    except grpc.RpcError as e:
+        reply, code = None, e.code()
+    if measured:
+        recorder.record(time.perf_counter() - start, code, reply)
+
+def runClosedLoop(stub, requests:list, concurrency:int, duration:float, warmup:float, deadline:float) -> Recorder:
+    """
+    Brief:
+        each of the clients sends the next request as soon as its previous one returns
+    """
+    recorder = Recorder()
+    begin = time.perf_counter()
+    measureFrom, end = begin + warmup, begin + warmup + duration
+
+    def client(index:int):
+        sent = index
+        while True:
+            start = time.perf_counter()
+            if start >= end:
+                break
+            sendBlocking(stub, requests[sent % len(requests)], deadline, recorder, start, start >= measureFrom)
+            sent += concurrency
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder
+
+def runOpenLoop(stub, requests:list, rate:float, duration:float, warmup:float, deadline:float, seed:int) -> Recorder:
+    """
+    Brief:
+        send the requests at Poisson arrival times of the given rate, whether or not the
+        previous ones returned
+    """
+    recorder = Recorder()
+    rng = np.random.default_rng(seed)
+    begin = time.perf_counter()
+    measureFrom, end = begin + warmup, begin + warmup + duration
+    pending = []
+    due, sent = begin, 0
+    while True:
+        due += rng.exponential(1.0 / rate)
+        if due >= end:
+            break
+        time.sleep(max(0.0, due - time.perf_counter()))
+        future = stub.Schedule.future(requests[sent % len(requests)], timeout=deadline)
+
+        def done(future, due = due, measured = due >= measureFrom):
+            if not measured:
+                return
+            if future.code() == grpc.StatusCode.OK:
+                recorder.record(time.perf_counter() - due, grpc.StatusCode.OK, future.result())
+            else:
+                recorder.record(time.perf_counter() - due, future.code())
+        future.add_done_callback(done)
+        pending.append(future)
+        sent += 1
+    for future in pending:
+        try:
+            future.result()
+        except grpc.RpcError:
+            pass
+    return recorder
+
+def startServer(port:int, env:list) -> subprocess.Popen:
+    """
+    Brief:
+        start main.py on the given port, with KEY=VALUE settings added to the environment
+    """
+    environment = dict(os.environ, ESS_PORT=str(port))
+    environment.setdefault("ESS_LOG_LEVEL", "WARNING")
+    environment.update(setting.split("=", 1) for setting in env)
+    return subprocess.Popen([sys.executable, "-u", "main.py"], cwd=ROOT, env=environment)
+
+def stopServer(server:subprocess.Popen):
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="host:port of a running server, by default one is started from main.py")
+    parser.add_argument("--port", type=int, default=50151, help="port of the started server")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE setting of the started server, repeatable")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, nargs="+", help="numbers of concurrent clients, closed loop")
+    load.add_argument("--rate", type=float, nargs="+", help="request rates per second, open loop")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured at each load")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of load sent before measuring")
+    parser.add_argument("--deadline", type=float, help="seconds of the deadline of each RPC, none by default")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200], help="numbers of suppliers of the instances")
+    parser.add_argument("--riders", type=float, default=0.05, help="riders per supplier")
+    parser.add_argument("--instances", type=int, default=8, help="distinct instances of each size, sent in turn")
+    parser.add_argument("--items", type=int, default=10, help="number of item types")
+    parser.add_argument("--order-items", type=int, default=3, help="number of item types of the order")
+    parser.add_argument("--demand", type=float, default=20.0, help="mean amount of each item of the order")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the instances and of the arrival times")
+    parser.add_argument("--json", help="write the reports to this file")
+    args = parser.parse_args()
+    if args.rate is None and args.concurrency is None:
+        args.concurrency = [1, 4, 16]
+
+    requests = [makeRequest(numSupplier, max(1, int(round(numSupplier * args.riders))), numItem=args.items,
+                            numOrderItem=args.order_items, demand=args.demand, seed=args.seed + index)
+                for numSupplier in args.sizes for index in range(args.instances)]
+
+    server = None
+    if args.target is None:
+        server = startServer(args.port, args.env)
+        args.target = "localhost:{}".format(args.port)
+    reports = []
+    try:
+        with grpc.insecure_channel(args.target, options=[("grpc.max_send_message_length", -1), ("grpc.max_receive_message_length", -1)]) as channel:
+            grpc.channel_ready_future(channel).result(timeout=30)
+            stub = interface_pb2_grpc.AlgorithmStub(channel)
+            stub.Ping(PingRequest(message="loadtest"), timeout=10)
+
+            print("{:>6} {:>9} {:>7} {:>6} {:>6} {:>9} {:>9} {:>7} {:>9} {:>9} {:>9} {:>9}".format(
+                "mode", "load", "sent", "ok", "empty", "deadline", "rejected", "errors", "rps", "p50 ms", "p95 ms", "p99 ms"))
+            loads = [("clients", value) for value in args.concurrency] if args.rate is None else [("rate", value) for value in args.rate]
+            for mode, value in loads:
+                if mode == "clients":
+                    recorder = runClosedLoop(stub, requests, value, args.duration, args.warmup, args.deadline)
+                else:
+                    recorder = runOpenLoop(stub, requests, value, args.duration, args.warmup, args.deadline, args.seed)
+                report = dict(recorder.report(args.duration), mode=mode, load=value)
+                reports.append(report)
+                print("{:>6} {:>9g} {:>7} {:>6} {:>6} {:>9} {:>9} {:>7} {:>9.2f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+                    mode, value, report["sent"], report["ok"], report["empty"], report["deadline_exceeded"], report["rejected"], report["errors"],
+                    report["throughput"], report["p50"], report["p95"], report["p99"]))
+    finally:
+        if server is not None:
+            stopServer(server)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"args": vars(args), "reports": reports}, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark the multi-start local search over the number of trajectories and of worker
+processes. For a fixed master seed the best cost only depends on the number of
+trajectories, so the workers only change the latency.
+
+    python3 benchmark/multistart_benchmark.py --sizes 500 2000 --starts 1 4 16 --workers 1 2 4 8
+"""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ESS_Protobuf")))
+
+import argparse
+import time
+import DVPR
+from instances import makeRequest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--starts", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--riders", type=int, default=50)
+    parser.add_argument("--side", type=float, default=2000.0, help="side of the square the units are spread over")
+    parser.add_argument("--items", type=int, default=5, help="number of item types of the order")
+    parser.add_argument("--demand", type=float, default=30.0, help="mean amount of each item of the order")
+    parser.add_argument("--iterations", type=int, default=200, help="local search iterations of each trajectory")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the instances and master seed of the search")
+    args = parser.parse_args()
+
+    print("{:>8} {:>7} {:>8} {:>12} {:>12} {:>9}".format("n", "starts", "workers", "best cost", "latency ms", "speedup"))
+    for numSupplier in args.sizes:
+        request = makeRequest(numSupplier, args.riders, numOrderItem=args.items, demand=args.demand, side=args.side, seed=args.seed)
+        for numStart in args.starts:
+            baseline = None
+            for numWorkers in args.workers:
+                if numWorkers > numStart and numWorkers != args.workers[0]:
+                    continue
+                scheduler = DVPR.RouteScheduler(maxIteration=args.iterations, numStart=numStart, numWorkers=numWorkers, seed=args.seed)
+                # a first search starts the worker processes
+                scheduler.searchRoute(scheduler.initializeFromRequest(request))
+                context = scheduler.initializeFromRequest(request)
+                start = time.perf_counter()
+                route = scheduler.searchRoute(context)
+                elapsed = time.perf_counter() - start
+                scheduler.close()
+                baseline = elapsed if baseline is None else baseline
+                cost = route.cost if route is not None else float("inf")
+                print("{:>8} {:>7} {:>8} {:>12.1f} {:>12.1f} {:>8.1f}x".format(numSupplier, numStart, numWorkers, cost, elapsed * 1e3, baseline / elapsed))
+
+if __name__ == "__main__":
+    main()
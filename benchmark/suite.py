@@ -0,0 +1,132 @@
+"""
+Benchmark RouteScheduler.scheduleRoute end to end over instance sizes: the latency of each
+phase and of the whole call, and the cost of the returned route. The results can be saved
+as a baseline and later runs compared against it, exiting with 1 on a regression.
+
+    python3 benchmark/suite.py --save benchmark/baseline.json
+    python3 benchmark/suite.py --compare benchmark/baseline.json
+"""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ESS_Protobuf")))
+
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+import DVPR
+from DVPR.distance import buildDistanceMatrix
+from instances import makeRequest
+
+PHASES = ["ingest", "candidates", "neighborhood", "clustering", "exact", "greedy", "search", "multistart", "sequencing"]
+
+def routeCost(request, response) -> float:
+    """
+    Brief:
+        the cost of a reply: its rider to its suppliers in order, then to the order
+    """
+    if len(response.route) == 0:
+        return float("inf")
+    numSupplier = len(request.itemlists)
+    distanceMatrix = buildDistanceMatrix(request.distance, numSupplier, request.num_deliverer)
+    path = [numSupplier + response.deliverer_id] + [route.supplier_id for route in response.route] + [0]
+    return float(distanceMatrix[path[:-1], path[1:]].sum())
+
+def phaseSeconds(snapshot:dict) -> dict:
+    """
+    Brief:
+        the seconds of each phase recorded in a metrics snapshot
+    """
+    seconds = {}
+    for (name, labels), (_, _, total, _) in snapshot["histograms"].items():
+        if name == "phase_seconds":
+            seconds[dict(labels)["phase"]] = total
+    return seconds
+
+def runCase(scheduler, request, repeat:int) -> dict:
+    """
+    Brief:
+        run one instance repeat times, keeping the median latency of the call and of each phase
+    """
+    latencies, phases = [], []
+    for _ in range(repeat):
+        DVPR.metrics.drain()
+        start = time.perf_counter()
+        response = scheduler.scheduleRoute(request)
+        latencies.append(time.perf_counter() - start)
+        phases.append(phaseSeconds(DVPR.metrics.drain()))
+    return {
+        "cost": routeCost(request, response),
+        "latency": float(np.median(latencies)),
+        "phases": {phase: float(np.median([run.get(phase, 0.0) for run in phases])) for phase in PHASES if any(phase in run for run in phases)},
+    }
+
+def compare(results:dict, baseline:dict, latencyTolerance:float, costTolerance:float) -> list:
+    """
+    Brief:
+        compare the results with a baseline
+    Returns:
+        regressions (list) : a message for each case slower or worse than the baseline
+    """
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline["results"]:
+            continue
+        previous = baseline["results"][case]
+        if result["latency"] > previous["latency"] * latencyTolerance:
+            regressions.append("{}: latency {:.1f} ms, baseline {:.1f} ms".format(case, 1e3 * result["latency"], 1e3 * previous["latency"]))
+        if result["cost"] > previous["cost"] * (1 + costTolerance):
+            regressions.append("{}: cost {:.1f}, baseline {:.1f}".format(case, result["cost"], previous["cost"]))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000, 2000], help="numbers of suppliers")
+    parser.add_argument("--riders", type=float, default=0.05, help="riders per supplier")
+    parser.add_argument("--items", type=int, default=10, help="number of item types")
+    parser.add_argument("--order-items", type=int, default=3, help="number of item types of the order")
+    parser.add_argument("--demand", type=float, default=20.0, help="mean amount of each item of the order")
+    parser.add_argument("--metric", default="euclidean", choices=["euclidean", "manhattan"])
+    parser.add_argument("--iterations", type=int, default=100, help="local search iterations")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--distance-dtype", default="float64", choices=["float64", "float32"], help="storage type of the distance matrix")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the instances and of the search")
+    parser.add_argument("--save", help="write the results to this baseline file")
+    parser.add_argument("--compare", help="compare the results with this baseline file")
+    parser.add_argument("--latency-tolerance", type=float, default=1.25, help="allowed latency ratio to the baseline")
+    parser.add_argument("--cost-tolerance", type=float, default=0.01, help="allowed relative cost increase over the baseline")
+    args = parser.parse_args()
+
+    scheduler = DVPR.RouteScheduler(maxIteration=args.iterations, seed=args.seed, distanceDtype=np.dtype(args.distance_dtype))
+    results = {}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print("{:>6} {:>6} {:>10} {:>10}  {}".format("n", "riders", "cost", "total ms", "phases ms"))
+    for numSupplier in args.sizes:
+        numRider = max(1, int(round(numSupplier * args.riders)))
+        request = makeRequest(numSupplier, numRider, numItem=args.items, numOrderItem=args.order_items,
+                              demand=args.demand, metric=args.metric, seed=args.seed)
+        case = "{}x{}".format(numSupplier, numRider)
+        results[case] = result = runCase(scheduler, request, args.repeat)
+        phases = " ".join("{}={:.2f}".format(phase, 1e3 * seconds) for phase, seconds in result["phases"].items())
+        line = "{:>6} {:>6} {:>10.1f} {:>10.2f}  {}".format(numSupplier, numRider, result["cost"], 1e3 * result["latency"], phases)
+        if baseline is not None and case in baseline["results"]:
+            previous = baseline["results"][case]
+            line += "  (baseline {:.1f}, {:.2f} ms)".format(previous["cost"], 1e3 * previous["latency"])
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"args": vars(args), "python": platform.python_version(), "machine": platform.machine(), "results": results}, file, indent=2)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.latency_tolerance, args.cost_tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark the warm start on consecutive snapshots that change a little: each request is
+scheduled cold and from the context of the previous one, at several local search
+iteration limits. The costs are compared with a cold start of many iterations, and the
+initialization latency (ingestion, neighborhoods and clustering) of both is reported.
+
+    python3 benchmark/warmstart_benchmark.py --sizes 500 2000 --iterations 0 10 50 200
+"""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "ESS_Protobuf")))
+
+import argparse
+import time
+
+import numpy as np
+import DVPR
+from instances import makeSnapshots
+
+def scheduleChain(scheduler, requests:list, warm:bool):
+    """
+    Brief:
+        schedule the snapshots in turn, each one from the context of the last if warm
+    Returns:
+        costs (list) : the cost of the route of each snapshot
+        seconds (list) : the initialization seconds of each snapshot
+    """
+    costs, seconds = [], []
+    previous = None
+    for request in requests:
+        start = time.perf_counter()
+        context = scheduler.initializeFromRequest(request, previous=previous if warm else None)
+        seconds.append(time.perf_counter() - start)
+        route = scheduler.searchRoute(context)
+        costs.append(route.cost if route is not None else float("inf"))
+        previous = context
+    return costs, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000], help="numbers of suppliers")
+    parser.add_argument("--riders", type=int, default=50)
+    parser.add_argument("--snapshots", type=int, default=10)
+    parser.add_argument("--instances", type=int, default=5, help="series of snapshots of each size")
+    parser.add_argument("--stock-changes", type=int, default=5, help="suppliers whose stock changes between snapshots")
+    parser.add_argument("--rider-moves", type=int, default=2, help="riders that move between snapshots")
+    parser.add_argument("--order-shift", type=float, default=100.0, help="standard deviation of the move of the order")
+    parser.add_argument("--items", type=int, default=3, help="number of item types of the order")
+    parser.add_argument("--demand", type=float, default=30.0, help="mean amount of each item of the order")
+    parser.add_argument("--iterations", type=int, nargs="+", default=[0, 10, 50, 200], help="local search iteration limits")
+    parser.add_argument("--reference", type=int, default=2000, help="iterations of the reference cold start")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the snapshots and of the search")
+    args = parser.parse_args()
+
+    print("{:>6} {:>10} {:>12} {:>12} {:>12} {:>12}".format("n", "iterations", "cold gap %", "warm gap %", "cold init ms", "warm init ms"))
+    for numSupplier in args.sizes:
+        series = [makeSnapshots(numSupplier, args.riders, args.snapshots, numStockChange=args.stock_changes, numRiderMove=args.rider_moves,
+                                orderShift=args.order_shift, numOrderItem=args.items, demand=args.demand, seed=args.seed + index)
+                  for index in range(args.instances)]
+        reference = DVPR.RouteScheduler(maxIteration=args.reference, seed=args.seed, exactThreshold=None)
+        best = [scheduleChain(reference, requests, warm=False)[0] for requests in series]
+        for maxIteration in args.iterations:
+            scheduler = DVPR.RouteScheduler(maxIteration=maxIteration, seed=args.seed, exactThreshold=None)
+            coldGaps, warmGaps, coldSeconds, warmSeconds = [], [], [], []
+            for requests, bestCosts in zip(series, best):
+                coldCosts, seconds = scheduleChain(scheduler, requests, warm=False)
+                coldSeconds += seconds[1:]
+                warmCosts, seconds = scheduleChain(scheduler, requests, warm=True)
+                warmSeconds += seconds[1:]
+                # the first snapshot is a cold start in both chains
+                coldGaps += (np.array(coldCosts[1:]) / np.array(bestCosts[1:]) - 1).tolist()
+                warmGaps += (np.array(warmCosts[1:]) / np.array(bestCosts[1:]) - 1).tolist()
+            print("{:>6} {:>10} {:>12.2f} {:>12.2f} {:>12.2f} {:>12.2f}".format(numSupplier, maxIteration, 100 * np.mean(coldGaps), 100 * np.mean(warmGaps),
+                                                                            1e3 * np.median(coldSeconds), 1e3 * np.median(warmSeconds)))
+
+if __name__ == "__main__":
+    main()
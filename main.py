@@ -1,10 +1,17 @@
 import os, sys
-import traceback
+import asyncio
+import logging
+import multiprocessing
+import signal
 sys.path.insert(0, os.path.abspath("./ESS_Protobuf"))
 
 from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
 import time
 import grpc
+import numpy as np
 from ESS_Protobuf.interface_pb2 import (
     ItemList,
     Route,
@@ -14,30 +21,286 @@ from ESS_Protobuf.interface_pb2 import (
 import ESS_Protobuf.interface_pb2_grpc as interface_pb2_grpc
 import DVPR
 
-scheduler = DVPR.RouteScheduler() # new scheduler
+logger = logging.getLogger("ess")
+
+def optionalEnv(name:str, cast, default = None):
+    """
+    read an optional setting from the environment, "none" or an empty value disables it
+    """
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return None if value.strip().lower() in ("", "none") else cast(value)
+
+# the local search stops at the first of these limits, and at the deadline of the RPC
+MAX_ITERATION = optionalEnv("ESS_MAX_ITERATION", int, 100)
+TIME_BUDGET = optionalEnv("ESS_TIME_BUDGET", float) # seconds per request when the client sets no deadline
+MAX_STALL_ITERATION = optionalEnv("ESS_MAX_STALL_ITERATION", int)
+# seconds kept from the RPC deadline to build and send the reply
+DEADLINE_MARGIN = float(os.environ.get("ESS_DEADLINE_MARGIN", "0.05"))
+
+# independent local search trajectories per request, the processes running them and their master seed
+NUM_START = int(os.environ.get("ESS_NUM_START", "1"))
+SEARCH_WORKERS = int(os.environ.get("ESS_SEARCH_WORKERS", "1"))
+SEED = optionalEnv("ESS_SEED", int)
+# orders with at most this many relevant suppliers are solved exactly, at most 16, "none" to always search
+EXACT_THRESHOLD = optionalEnv("ESS_EXACT_THRESHOLD", int, 12)
+# keep only this many suppliers of each requested item, the nearest to the order, unset to keep all
+CANDIDATES_PER_ITEM = optionalEnv("ESS_CANDIDATES_PER_ITEM", int)
+# the number of moves the local search scores at once in each step
+BATCH_SIZE = int(os.environ.get("ESS_BATCH_SIZE", "1"))
+
+# the storage type of the distance matrix, "float32" halves its memory
+DISTANCE_DTYPE = os.environ.get("ESS_DISTANCE_DTYPE", "float64")
+
+scheduler = DVPR.RouteScheduler(maxIteration=MAX_ITERATION, timeBudget=TIME_BUDGET, maxStallIteration=MAX_STALL_ITERATION,
+                                numStart=NUM_START, numWorkers=SEARCH_WORKERS, seed=SEED, exactThreshold=EXACT_THRESHOLD,
+                                candidatesPerItem=CANDIDATES_PER_ITEM, batchSize=BATCH_SIZE, distanceDtype=np.dtype(DISTANCE_DTYPE)) # new scheduler, it keeps no per-request state and is shared by all workers
+
+# answer the requests sent again within ESS_CACHE_TTL seconds from a cache of this many replies, 0 to disable
+CACHE_SIZE = int(os.environ.get("ESS_CACHE_SIZE", "0"))
+CACHE_TTL = optionalEnv("ESS_CACHE_TTL", float, 60.0)
+# the cache lives in the serving process, so the process pool workers share it
+cache = DVPR.ResultCache(CACHE_SIZE, CACHE_TTL) if CACHE_SIZE > 0 else None
+
+# start each request from the clusters and best route of the last one, for snapshots that change a little between requests
+WARM_START = bool(int(os.environ.get("ESS_WARM_START", "0")))
+warmContext = None # the context of the last request scheduled in this process
+
+# run the scheduling in a process pool of this size instead of the gRPC worker threads, 0 to disable
+PROCESS_WORKERS = int(os.environ.get("ESS_PROCESS_WORKERS", "0"))
+# the log level, DEBUG logs every supplier, rider, route and reply
+LOG_LEVEL = os.environ.get("ESS_LOG_LEVEL", "INFO").upper()
+# serve the metrics in the Prometheus text format on this port, 0 to disable
+METRICS_PORT = int(os.environ.get("ESS_METRICS_PORT", "0"))
+# the gRPC port and the number of threads serving the RPCs, the scheduling threads of the aio server
+PORT = int(os.environ.get("ESS_PORT", "50051"))
+GRPC_WORKERS = int(os.environ.get("ESS_GRPC_WORKERS", "10"))
+# "sync" for the thread pool server, "aio" for the asyncio server running the scheduling in an executor
+SERVER_MODE = os.environ.get("ESS_SERVER_MODE", "sync").lower()
+# the RPCs served at once, the next ones are rejected with RESOURCE_EXHAUSTED, "none" for no limit
+MAX_INFLIGHT = optionalEnv("ESS_MAX_INFLIGHT", int, 2 * (PROCESS_WORKERS if PROCESS_WORKERS > 0 else GRPC_WORKERS))
+# the seconds the RPCs in flight may take to finish on SIGTERM or SIGINT, before they are cancelled
+DRAIN_TIMEOUT = float(os.environ.get("ESS_DRAIN_TIMEOUT", "30"))
+
+def getDeadline(context):
+    """
+    the time.monotonic() deadline of the RPC minus the reply margin, None if the client set no deadline
+    """
+    remaining = context.time_remaining()
+    if remaining is None:
+        return None
+    return time.monotonic() + remaining - DEADLINE_MARGIN
+
+def scheduleRequest(request, deadline:float = None, distances:np.ndarray = None):
+    """
+    schedule a request, from the context of the last one with ESS_WARM_START, and from its
+    distance vector if it was already converted
+    """
+    global warmContext
+    if not WARM_START:
+        response, _ = scheduler.scheduleIncremental(request, None, deadline, distances)
+        return response
+    response, warmContext = scheduler.scheduleIncremental(request, warmContext, deadline, distances)
+    return response
+
+def initWorker():
+    """
+    start a process pool worker with empty metrics, a forked one inherits the series of the server
+    """
+    DVPR.metrics.drain()
+
+def scheduleInWorker(request, deadline:float = None):
+    """
+    schedule a request in a process pool worker, and send back the metrics it recorded with the reply
+    """
+    response = scheduleRequest(request, deadline)
+    return response, DVPR.metrics.drain()
+
+class ProcessPool:
+    """
+    The process pool the requests are scheduled in. Its workers are forked from a forkserver,
+    as forking the gRPC process itself while its threads run crashes the children, and the
+    pool is rebuilt when a worker dies so one crash doesn't fail all of the later requests.
+    """
+    def __init__(self, numWorkers:int):
+        self.numWorkers = numWorkers
+        self.lock = threading.Lock()
+        self.executor = self.createExecutor()
+
+    def createExecutor(self) -> futures.ProcessPoolExecutor:
+        return futures.ProcessPoolExecutor(max_workers=self.numWorkers, mp_context=multiprocessing.get_context("forkserver"),
+                                           initializer=initWorker)
+
+    def schedule(self, request, deadline:float = None):
+        """
+        schedule a request in a worker, and merge the metrics it recorded
+        """
+        executor = self.executor
+        try:
+            response, workerMetrics = executor.submit(scheduleInWorker, request, deadline).result()
+        except BrokenProcessPool:
+            with self.lock:
+                # the first of the requests failing on the broken pool rebuilds it
+                if self.executor is executor:
+                    logger.error("A scheduling worker died, restarting the process pool")
+                    self.executor = self.createExecutor()
+                    # the broken pool already failed its pending futures with BrokenProcessPool
+                    executor.shutdown(wait=False)
+            raise
+        DVPR.metrics.merge(workerMetrics)
+        return response
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = DVPR.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics: " + format, *args)
+
+def handleSchedule(request, deadline:float = None, executor:ProcessPool = None):
+    """
+    answer a Schedule RPC from the cache or by scheduling it, in the process pool if one is given
+    """
+    response = None
+    distances = None
+    if cache is not None:
+        # the key hashes the distance vector, the scheduling in this process reuses it
+        distances = DVPR.toDistanceVector(request.distance)
+        key, response = cache.lookup(request, distances)
+    if response is None:
+        if executor is not None:
+            response = executor.schedule(request, deadline)
+        else:
+            response = scheduleRequest(request, deadline, distances)
+        if cache is not None:
+            cache.store(key, response)
+    return response
 
 class Algorithm(interface_pb2_grpc.AlgorithmServicer):
+    def __init__(self, executor:ProcessPool = None):
+        self.executor = executor
+
     def Ping(self, request, context):
-        print("Received: " + request.message)
+        logger.info("Received: %s", request.message)
         return PingReply(message = 'Pong')
     def Schedule(self, request, context):
         try:
-            response = scheduler.scheduleRoute(request)
+            response = handleSchedule(request, getDeadline(context), self.executor)
         except Exception as e:
-            traceback.print_exc()
-        print(response) # debug
+            logger.exception("Schedule failed")
+            DVPR.metrics.increment("requests", outcome="error")
+            response = ScheduleReply()
+        logger.debug("Reply: %s", response)
         return response
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    interface_pb2_grpc.add_AlgorithmServicer_to_server(Algorithm(), server)
-    server.add_insecure_port('[::]:50051')
+class AsyncAlgorithm(interface_pb2_grpc.AlgorithmServicer):
+    """
+    The servicer of the aio server. The event loop only admits the RPCs: at most
+    maxInflight Schedule RPCs are served at once and the next ones are rejected right
+    away with RESOURCE_EXHAUSTED, so a load spike can't queue requests past their
+    deadlines. The scheduling runs in the threads executor, and in the process pool
+    if one is given.
+    """
+    def __init__(self, threads:futures.ThreadPoolExecutor, executor:ProcessPool = None, maxInflight:int = None):
+        self.threads = threads
+        self.executor = executor
+        self.maxInflight = maxInflight
+        self.numInflight = 0 # only touched by the event loop
+
+    async def Ping(self, request, context):
+        logger.info("Received: %s", request.message)
+        return PingReply(message = 'Pong')
+
+    async def Schedule(self, request, context):
+        if self.maxInflight is not None and self.numInflight >= self.maxInflight:
+            DVPR.metrics.increment("requests", outcome="rejected")
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "{} requests in flight, retry later".format(self.numInflight))
+        self.numInflight += 1
+        try:
+            deadline = getDeadline(context)
+            response = await asyncio.get_running_loop().run_in_executor(self.threads, handleSchedule, request, deadline, self.executor)
+        except Exception as e:
+            logger.exception("Schedule failed")
+            DVPR.metrics.increment("requests", outcome="error")
+            response = ScheduleReply()
+        finally:
+            self.numInflight -= 1
+        logger.debug("Reply: %s", response)
+        return response
+
+def startMetricsServer():
+    """
+    serve the metrics on METRICS_PORT in a daemon thread, None if it is disabled
+    """
+    if METRICS_PORT <= 0:
+        return None
+    metricsServer = ThreadingHTTPServer(("", METRICS_PORT), MetricsHandler)
+    threading.Thread(target=metricsServer.serve_forever, daemon=True).start()
+    return metricsServer
+
+def shutdown(executor:ProcessPool, metricsServer):
+    if executor is not None:
+        executor.shutdown()
+    scheduler.close()
+    if metricsServer is not None:
+        metricsServer.shutdown()
+    # dump the metrics of the run
+    logger.info("Metrics:\n%s", DVPR.metrics.render())
+
+def serveSync(executor:ProcessPool):
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=GRPC_WORKERS), maximum_concurrent_rpcs=MAX_INFLIGHT)
+    interface_pb2_grpc.add_AlgorithmServicer_to_server(Algorithm(executor), server)
+    server.add_insecure_port('[::]:{}'.format(PORT))
     server.start()
-    try:
-        while True:
-            time.sleep(60*60*24)
-    except KeyboardInterrupt:
-        server.stop(0)
+    metricsServer = startMetricsServer()
+
+    def drain(signum, frame):
+        logger.info("Draining the RPCs in flight for up to %.0f seconds", DRAIN_TIMEOUT)
+        server.stop(DRAIN_TIMEOUT)
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, drain)
+    server.wait_for_termination()
+    shutdown(executor, metricsServer)
+
+async def serveAsync(executor:ProcessPool):
+    threads = futures.ThreadPoolExecutor(max_workers=GRPC_WORKERS)
+    server = grpc.aio.server()
+    interface_pb2_grpc.add_AlgorithmServicer_to_server(AsyncAlgorithm(threads, executor, MAX_INFLIGHT), server)
+    server.add_insecure_port('[::]:{}'.format(PORT))
+    await server.start()
+    metricsServer = startMetricsServer()
+
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+    await stopping.wait()
+    logger.info("Draining the RPCs in flight for up to %.0f seconds", DRAIN_TIMEOUT)
+    await server.stop(DRAIN_TIMEOUT)
+    threads.shutdown()
+    shutdown(executor, metricsServer)
+
+def serve():
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    executor = ProcessPool(PROCESS_WORKERS) if PROCESS_WORKERS > 0 else None
+    if executor is None and SEARCH_WORKERS > 1:
+        # start the trajectory pool before serving, the process pool workers start their own
+        scheduler.workerPool()
+    if SERVER_MODE == "aio":
+        asyncio.run(serveAsync(executor))
+    elif SERVER_MODE == "sync":
+        serveSync(executor)
+    else:
+        raise ValueError("Unknown ESS_SERVER_MODE {}, expected sync or aio".format(SERVER_MODE))
 
 if __name__ == '__main__':
     serve()